@@ -0,0 +1,148 @@
+import os
+import json
+import argparse
+import numpy as np
+from typing import Dict, List
+
+import soundfile as sf
+
+import calculate as calc
+import noise_retrieval
+import result_store
+from run_inference_NIC import PROMPT_TEXT
+
+
+NOISE_LIST = "data/noise_list.json"
+AUDIO_ROOT = "data/clotho"
+
+# prompt-size model: the ALM audio encoder emits ~25 tokens per second
+# (40 ms frames), text is ~4 characters per token
+AUDIO_TOKENS_PER_SECOND = 25
+CHARS_PER_TOKEN = 4
+TURN_TEXT = "Now caption the next audio. Follow the same rules."
+
+THRESHOLDS = [0.0, 0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 1.01]
+
+
+# =========================
+# Inputs
+# =========================
+def audio_tokens(path: str) -> float:
+    try:
+        return sf.info(path).duration * AUDIO_TOKENS_PER_SECOND
+    except RuntimeError:
+        return 0.0
+
+
+def text_tokens(text: str) -> float:
+    return len(text) / CHARS_PER_TOKEN
+
+
+def exemplar_tokens(noise_list_path: str) -> Dict[str, float]:
+    """
+    Prompt tokens one exemplar adds: its user turn (text + audio) and assistant caption.
+    """
+    with open(noise_list_path, "r", encoding="utf-8") as f:
+        noise_list = json.load(f)
+    return {
+        item["audio_path"]: text_tokens(TURN_TEXT) + audio_tokens(item["audio_path"]) + text_tokens(item["caption"])
+        for item in noise_list
+    }
+
+
+def hallucination_flags(path: str) -> Dict[str, bool]:
+    return {
+        row["file_name"]: calc.parse_hallucination_flag(row.get("hallucination_detected", ""))
+        for row in result_store.iter_rows(path, columns=["file_name", "hallucination_detected"])
+    }
+
+
+def retrieved_exemplars(path: str) -> Dict[str, List[Dict]]:
+    """
+    file_name -> retrieved exemplars (best first) from a run_inference_NIC.py output.
+    Runs written before the tier was recorded are read as BEATs-scored.
+    """
+    out = {}
+    for row in result_store.iter_rows(path, columns=["file_name", "retrieved_exemplars"]):
+        exemplars = json.loads(row.get("retrieved_exemplars") or "[]")
+        for r in exemplars:
+            r.setdefault("tier", "beats")
+        out[row["file_name"]] = exemplars
+    return out
+
+
+# =========================
+# Report
+# =========================
+def report(nic_raw: str, nic_eval: str, base_eval: str, max_k: int, thresholds: List[float],
+           audio_root: str = AUDIO_ROOT, noise_list_path: str = NOISE_LIST) -> List[dict]:
+    """
+    Simulate similarity-gated exemplar selection on a fixed-k NIC run.
+
+    Prompt tokens are counted per clip from the exemplars that pass the gate,
+    which is noise_retrieval.gate_exemplars: only BEATs-scored exemplars are
+    thresholded, spectral pre-filter ones are always kept.
+    HR is estimated by taking the plain-ALM label (base_eval) for clips that
+    would get no exemplar and the fixed-k NIC label for the rest, so the
+    HR column is exact for the zero-exemplar split and an approximation for
+    clips whose exemplar count is only reduced.
+    """
+    retrieved = retrieved_exemplars(nic_raw)
+    nic, base = hallucination_flags(nic_eval), hallucination_flags(base_eval)
+    names = [n for n in retrieved if n in nic and n in base]
+    if not names:
+        return []
+
+    per_exemplar = exemplar_tokens(noise_list_path)
+    fixed = text_tokens(PROMPT_TEXT) + text_tokens(TURN_TEXT)
+    query = np.array([fixed + audio_tokens(os.path.join(audio_root, n)) for n in names])
+
+    def gated(t):
+        """
+        (exemplars kept, their prompt tokens) per clip at threshold t.
+        """
+        used = [noise_retrieval.gate_exemplars(retrieved[n], t, max_k) for n in names]
+        return (np.array([len(u) for u in used]),
+                np.array([sum(per_exemplar.get(r["audio_path"], 0.0) for r in u) for u in used]))
+
+    hall_nic = np.array([nic[n] for n in names], dtype=float)
+    hall_base = np.array([base[n] for n in names], dtype=float)
+    full_tokens = (query + gated(None)[1]).mean()
+
+    rows = []
+    for t in thresholds:
+        k, cost = gated(t)
+        tokens = (query + cost).mean()
+        hr = np.where(k == 0, hall_base, hall_nic).mean()
+        rows.append({
+            "threshold": t,
+            "mean_k": round(float(k.mean()), 2),
+            "zero_k": round(float((k == 0).mean()), 4),
+            "tokens/clip": round(float(tokens), 1),
+            "token_saving": round(float(1 - tokens / full_tokens), 4),
+            "est_hr": round(float(hr), 4),
+            "hr_diff": round(float(hr - hall_nic.mean()), 4),
+        })
+    print(f"clips={len(names)} fixed k={max_k}: {full_tokens:.1f} tokens/clip, HR={hall_nic.mean():.4f}; "
+          f"no exemplars: {query.mean():.1f} tokens/clip, HR={hall_base.mean():.4f}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt-token saving and HR impact of similarity-gated NIC exemplars.")
+    parser.add_argument("nic_raw", help="run_inference_NIC.py output with retrieved_exemplars (fixed top-k run)")
+    parser.add_argument("nic_eval", help="evaluated CSV of the same NIC run")
+    parser.add_argument("base_eval", help="evaluated CSV of the plain run_inference_api.py run")
+    parser.add_argument("--max-k", type=int, default=4)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=THRESHOLDS)
+    parser.add_argument("--audio-root", default=AUDIO_ROOT)
+    parser.add_argument("--noise-list", default=NOISE_LIST)
+    args = parser.parse_args()
+
+    rows = report(args.nic_raw, args.nic_eval, args.base_eval, args.max_k, args.thresholds,
+                  audio_root=args.audio_root, noise_list_path=args.noise_list)
+    print(calc.format_table(rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import json
+import functools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import torch
+import torchaudio
+
+try:
+    import soundfile as sf
+except ImportError:  # falls back to torchaudio.load
+    sf = None
+
+
+# =========================
+# Config
+# =========================
+SAMPLE_RATE = 16000
+# threads decoding files in load_many; decoding and resampling release the GIL
+LOAD_WORKERS = 8
+
+
+@functools.lru_cache(maxsize=None)
+def get_resampler(orig_sr: int, target_sr: int) -> torchaudio.transforms.Resample:
+    """
+    One Resample transform per (orig_sr, target_sr): the sinc kernel is built
+    once instead of on every call to torchaudio.functional.resample.
+    """
+    return torchaudio.transforms.Resample(orig_sr, target_sr)
+
+
+def decode(path: str) -> Tuple[torch.Tensor, int]:
+    """
+    Decode an audio file to float32 in [-1, 1].
+    Return: Tensor [C, T], sample rate
+    """
+    if sf is not None:
+        try:
+            data, sr = sf.read(path, dtype="float32", always_2d=True)
+            return torch.from_numpy(data.T), sr
+        except RuntimeError:
+            pass  # formats libsndfile cannot read (e.g. mp3 on old libsndfile)
+    return torchaudio.load(path)
+
+
+# =========================
+# Decoded-audio shard
+# =========================
+def file_key(path: str) -> List[int]:
+    """
+    Cheap identity of a source file for the shard: [size, mtime_ns].
+    """
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class AudioShard:
+    """
+    Pre-decoded mono audio at one sample rate: every clip's float32 samples
+    concatenated in <prefix>.f32, plus <prefix>.json mapping
+    file_name -> [offset, length, size, mtime_ns]; offset and length are in
+    samples, size and mtime_ns identify the source file the clip was decoded
+    from (file_key). Written by build_audio_shard.py.
+    """
+
+    def __init__(self, prefix: str):
+        with open(prefix + ".json", "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.prefix = prefix
+        self.sample_rate = index["sample_rate"]
+        self.files = index["files"]
+        if any(len(entry) != 4 for entry in self.files.values()):
+            raise ValueError(f"{prefix}.json has no source file keys; rebuild it with build_audio_shard.py")
+        # copy-on-write: slices are writable tensors that never touch the file
+        self.samples = np.memmap(prefix + ".f32", dtype=np.float32, mode="c")
+
+    def __contains__(self, file_name: str) -> bool:
+        return file_name in self.files
+
+    def get(self, file_name: str) -> torch.Tensor:
+        """
+        Zero-copy view of one clip.
+        Return: Tensor [1, T]
+        """
+        offset, length = self.files[file_name][:2]
+        return torch.from_numpy(self.samples[offset:offset + length]).unsqueeze(0)
+
+    def lookup(self, path: str) -> Optional[torch.Tensor]:
+        """
+        get() for the clip decoded from `path`, or None when the shard has no
+        clip of that name or it was decoded from a different (or changed) file.
+        """
+        entry = self.files.get(os.path.basename(path))
+        try:
+            if entry is None or entry[2:] != file_key(path):
+                return None
+        except OSError:
+            return None
+        return self.get(os.path.basename(path))
+
+
+_shard: Optional[AudioShard] = None
+
+
+def open_shard(prefix: str) -> AudioShard:
+    """
+    Serve load_audio from a decoded-audio shard; files missing from it, or
+    changed since it was built, are still decoded from disk.
+    """
+    global _shard
+    _shard = AudioShard(prefix)
+    return _shard
+
+
+def load_audio(path: str, target_sr: int = SAMPLE_RATE) -> torch.Tensor:
+    """
+    Load audio as mono and resample to target_sr.
+    Return: Tensor [1, T]
+    """
+    if _shard is not None and target_sr == _shard.sample_rate:
+        wav = _shard.lookup(path)
+        if wav is not None:
+            return wav
+
+    wav, sr = decode(path)
+    # downmix first so only one channel is resampled
+    if wav.shape[0] > 1:
+        wav = wav.mean(dim=0, keepdim=True)
+    if sr != target_sr:
+        with torch.no_grad():
+            wav = get_resampler(sr, target_sr)(wav)
+    return wav
+
+
+def load_many(paths: List[str], target_sr: int = SAMPLE_RATE, max_workers: int = LOAD_WORKERS) -> List[torch.Tensor]:
+    """
+    load_audio for many files on a thread pool, in input order.
+    """
+    if len(paths) <= 1:
+        return [load_audio(p, target_sr) for p in paths]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        return list(pool.map(lambda p: load_audio(p, target_sr), paths))
@@ -0,0 +1,63 @@
+import os
+import csv
+import json
+import numpy as np
+from tqdm import tqdm
+import audio_io
+
+META_CSV = "data/data.csv"
+
+AUDIO_ROOT = "data/clotho"
+
+NOISE_DIR = "data/noise"
+
+# writes <prefix>.f32 (concatenated 16 kHz mono float32) and <prefix>.json (file_name index
+# with each source file's size and mtime, so changed files are decoded again)
+OUTPUT_PREFIX = "checkpoints/audio_shard"
+
+# clips decoded per step on the audio_io thread pool
+CHUNK_SIZE = 64
+
+
+def main():
+    with open(META_CSV, "r", encoding="utf-8") as f:
+        names = list(dict.fromkeys(row["file_name"] for row in csv.DictReader(f)))
+    paths = [os.path.join(AUDIO_ROOT, n) for n in names]
+    paths += sorted(os.path.join(NOISE_DIR, n) for n in os.listdir(NOISE_DIR) if n.endswith(".wav"))
+
+    present = []
+    for path in paths:
+        if os.path.exists(path):
+            present.append(path)
+        else:
+            print(path)
+    print(f"{len(present)} / {len(paths)} clips found")
+
+    # the shard is keyed by file_name, so names must be unique across folders
+    seen = {}
+    for path in present:
+        name = os.path.basename(path)
+        if name in seen:
+            raise ValueError(f"duplicate file_name {name}: {seen[name]} and {path}")
+        seen[name] = path
+
+    os.makedirs(os.path.dirname(OUTPUT_PREFIX) or ".", exist_ok=True)
+    files, offset = {}, 0
+    with open(OUTPUT_PREFIX + ".f32.tmp", "wb") as out:
+        for start in tqdm(range(0, len(present), CHUNK_SIZE), desc="Decoding"):
+            chunk = present[start:start + CHUNK_SIZE]
+            for path, wav in zip(chunk, audio_io.load_many(chunk)):
+                samples = wav.reshape(-1).numpy().astype(np.float32)
+                out.write(samples.tobytes())
+                files[os.path.basename(path)] = [offset, int(samples.shape[0])] + audio_io.file_key(path)
+                offset += samples.shape[0]
+
+    os.replace(OUTPUT_PREFIX + ".f32.tmp", OUTPUT_PREFIX + ".f32")
+    with open(OUTPUT_PREFIX + ".json", "w", encoding="utf-8") as f:
+        json.dump({"sample_rate": audio_io.SAMPLE_RATE, "files": files}, f, ensure_ascii=False)
+
+    print(f"{OUTPUT_PREFIX}.f32: {offset / audio_io.SAMPLE_RATE / 3600:.2f} h of audio, {offset * 4 / 2**30:.2f} GiB")
+
+
+if __name__ == "__main__":
+    main()
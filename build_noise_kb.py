@@ -0,0 +1,143 @@
+import os
+import json
+import argparse
+import multiprocessing
+import numpy as np
+import torch
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+
+import audio_io
+import noise_retrieval as noise_retrieval
+from model.beats.BEATs import BEATsConfig
+
+
+BEATS_CKPT = "checkpoints/BEATs_iter3_plus_AS2M_finetuned_on_AS2M_cpt2.pt"
+# the store NoiseKnowledgeBase(store_path=...) warm-starts from
+OUTPUT_STORE = "checkpoints/noise_kb_embeddings.npz"
+
+# clips per task; each worker writes one task's rows into the shared matrix at once
+CHUNK_SIZE = 32
+THREADS_PER_WORKER = 2
+
+
+# =========================
+# Worker
+# =========================
+_encoder = None
+_threads = THREADS_PER_WORKER
+
+
+def init_worker(ckpt: str, layer, precision: str, threads: int, shard_prefix: str = "",
+                chunk_seconds=None, chunk_hop_seconds: float = noise_retrieval.CHUNK_HOP_SECONDS):
+    global _encoder, _threads
+    # the cap covers decoding too: load_many's pool would otherwise add LOAD_WORKERS threads
+    _threads = threads
+    torch.set_num_threads(threads)
+    if shard_prefix:
+        audio_io.open_shard(shard_prefix)
+    _encoder = noise_retrieval.BEATsEncoder(
+        ckpt, chunk_seconds=chunk_seconds, chunk_hop_seconds=chunk_hop_seconds, layer=layer, precision=precision
+    )
+
+
+def encode_chunk(matrix_path: str, rows: list, paths: list) -> int:
+    """
+    Encode `paths` and write them to `rows` of the shared (N, D) .npy matrix.
+    """
+    wavs = audio_io.load_many(paths, max_workers=_threads)
+    embs = _encoder.encode_many(wavs).numpy().astype(np.float32)
+    matrix = np.load(matrix_path, mmap_mode="r+")
+    matrix[rows] = embs
+    matrix.flush()
+    return len(rows)
+
+
+# =========================
+# Build
+# =========================
+def build(noise_list_path: str, ckpt: str = BEATS_CKPT, out_store: str = OUTPUT_STORE,
+          workers: int = 0, threads: int = THREADS_PER_WORKER, chunk_size: int = CHUNK_SIZE,
+          layer=None, precision: str = "fp32", shard_prefix: str = "", chunk_seconds=None,
+          chunk_hop_seconds: float = noise_retrieval.CHUNK_HOP_SECONDS):
+    """
+    Encode every exemplar of a noise list JSON ([{"audio_path", "caption"}, ...])
+    into the embedding store, sharding clips across `workers` processes with
+    `threads` torch and decoding threads each. Clips already in the store are skipped.
+    shard_prefix: optional decoded-audio shard the workers read clips from.
+    chunk_seconds / chunk_hop_seconds: windowed encoding of long clips (see BEATsEncoder).
+    """
+    with open(noise_list_path, "r", encoding="utf-8") as f:
+        noise_list = json.load(f)
+    paths = list(dict.fromkeys(item["audio_path"] for item in noise_list))
+
+    fingerprint = noise_retrieval.encoder_fingerprint(
+        noise_retrieval.checkpoint_fingerprint(ckpt), layer, precision, chunk_seconds, chunk_hop_seconds
+    )
+    store = noise_retrieval.EmbeddingStore(out_store, fingerprint)
+    keys = [noise_retrieval.file_sha1(p) for p in paths]
+    todo = [i for i, k in enumerate(keys) if k not in store]
+    print(f"{len(paths)} exemplars, {len(paths) - len(todo)} already in {out_store}")
+    if not todo:
+        return
+
+    cfg = BEATsConfig(noise_retrieval.load_checkpoint_cfg(ckpt))
+    matrix_path = out_store + ".partial.npy"
+    os.makedirs(os.path.dirname(matrix_path) or ".", exist_ok=True)
+    np.lib.format.open_memmap(
+        matrix_path, mode="w+", dtype=np.float32, shape=(len(todo), cfg.encoder_embed_dim)
+    ).flush()
+
+    workers = workers or max(1, (os.cpu_count() or 1) // threads)
+    # small builds should not start more workers (and BEATs copies) than chunks
+    chunk_size = max(1, min(chunk_size, -(-len(todo) // workers)))
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+            max_workers=workers, mp_context=ctx,
+            initializer=init_worker,
+            initargs=(ckpt, layer, precision, threads, shard_prefix, chunk_seconds, chunk_hop_seconds),
+    ) as pool:
+        futures = [
+            pool.submit(
+                encode_chunk, matrix_path,
+                list(range(start, min(start + chunk_size, len(todo)))),
+                [paths[i] for i in todo[start:start + chunk_size]],
+            )
+            for start in range(0, len(todo), chunk_size)
+        ]
+        with tqdm(total=len(todo), desc=f"Encoding ({workers} workers x {threads} threads)") as bar:
+            for future in as_completed(futures):
+                bar.update(future.result())
+
+    matrix = np.load(matrix_path, mmap_mode="r")
+    for row, i in enumerate(todo):
+        store.put(keys[i], torch.from_numpy(np.array(matrix[row])))
+    del matrix
+    store.save()
+    os.remove(matrix_path)
+    print(out_store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the noise KB embedding store with parallel BEATs workers.")
+    parser.add_argument("noise_list", help='JSON list of {"audio_path", "caption"}')
+    parser.add_argument("--ckpt", default=BEATS_CKPT)
+    parser.add_argument("--out", default=OUTPUT_STORE)
+    parser.add_argument("--workers", type=int, default=0, help="0 = cpu_count // threads")
+    parser.add_argument("--threads", type=int, default=THREADS_PER_WORKER, help="torch and decoding threads per worker")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--layer", type=int, default=None)
+    parser.add_argument("--precision", choices=noise_retrieval.PRECISIONS, default="fp32")
+    parser.add_argument("--shard", default="", help="decoded-audio shard prefix (build_audio_shard.py)")
+    parser.add_argument("--chunk-seconds", type=float, default=None,
+                        help="encode clips longer than this as overlapping windows (default: whole clips)")
+    parser.add_argument("--chunk-hop-seconds", type=float, default=noise_retrieval.CHUNK_HOP_SECONDS)
+    args = parser.parse_args()
+
+    build(args.noise_list, ckpt=args.ckpt, out_store=args.out, workers=args.workers,
+          threads=args.threads, chunk_size=args.chunk_size, layer=args.layer, precision=args.precision,
+          shard_prefix=args.shard, chunk_seconds=args.chunk_seconds, chunk_hop_seconds=args.chunk_hop_seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,15 @@
+import os
 import csv
 import json
+import re
+import hashlib
+import argparse
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+import result_store
 
 EVAL_CSV = ""
 
@@ -15,146 +24,654 @@ EVENT_VERBS = VOCAB["EVENT_VERBS"]
 DEFINITE_TERMS = VOCAB["DEFINITE_TERMS"]
 ACOUSTIC_TERMS = VOCAB["ACOUSTIC_TERMS"]
 
-event_freqs = []
-def_freqs = []
-acoustic_freqs = []
-
-event_freqs_hall = []
-def_freqs_hall = []
-acoustic_freqs_hall = []
-
-
-def count_matches(text, vocab):
-    count = 0
-    for term in vocab:
-        if term in text:
-            count += 1
-    return count
-
-def evaluate_hallucination(csv_path: str):
-    total = 0
-    hall_count = 0
-
-    type_counter_all = Counter()      
-    type_counter_hall = Counter()     
-    combo_counter = Counter()         
-
-    with open(csv_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            total += 1
-
-            h = row.get("hallucination_detected", "")
-            if isinstance(h, str):
-                h = h.strip().lower()
-                if h in ["true", "1", "yes"]:
-                    h_flag = True
-                elif h in ["false", "0", "no", ""]:
-                    h_flag = False
-                else:
-                    h_flag = False
-            else:
-                h_flag = bool(h)
-
-            types_str = row.get("hallucination_types", "").strip()
-            if not types_str:
-                types = []
-            else:
-                try:
-                    types = json.loads(types_str)
-                    if not isinstance(types, list):
-                        types = [types]
-                except Exception:
-                    types = []
-
-
+# Terms the suffix rules get wrong: irregular verbs and plurals, and stress or
+# spelling the rules cannot see. A term listed here gets exactly these forms.
+INFLECTION_EXCEPTIONS = {
+    "run": ["runs", "running", "ran"],
+    "speak": ["speaks", "speaking", "spoke", "spoken"],
+    "sing": ["sings", "singing", "sang", "sung"],
+    "ring": ["rings", "ringing", "rang", "rung"],
+    "break": ["breaks", "breaking", "broke", "broken"],
+    "fall": ["falls", "falling", "fell", "fallen"],
+    "drive": ["drives", "driving", "drove", "driven"],
+    "hit": ["hits", "hitting"],
+    "open": ["opens", "opened", "opening"],
+    "echo": ["echoes", "echoed", "echoing"],
+    "engine": ["engines"],
+    "man": ["men"],
+    "woman": ["women"],
+    "child": ["children"],
+    "person": ["persons"],
+}
+
+# Part of speech of the descriptor terms (DEFINITE_TERMS / ACOUSTIC_TERMS); every
+# EVENT_VERBS term is a verb. Terms not listed (adverbs, participles, plurals,
+# mass nouns, multi-word terms) are matched verbatim.
+DESCRIPTOR_VERBS = {"sound", "hum", "hiss", "rumble", "rain"}
+DESCRIPTOR_NOUNS = {
+    "man", "woman", "child", "person", "dog", "cat", "vehicle", "car", "train", "crowd",
+    "conversation", "speech", "noise", "background", "reverberation", "wind", "water", "echo",
+}
+DESCRIPTOR_ADJECTIVES = {
+    "loud", "quiet", "mechanical", "continuous", "intermittent", "distant", "faint",
+    "indistinct", "environmental",
+}
+
+VOWELS = "aeiou"
+
+
+def plural(term):
+    if term.endswith("y") and term[-2:-1] not in VOWELS:
+        return term[:-1] + "ies"
+    if term.endswith(("s", "sh", "ch", "x", "z")) or (term.endswith("o") and term[-2:-1] not in VOWELS):
+        return term + "es"
+    return term + "s"
+
+
+def verb_forms(term):
+    """
+    3rd person, past tense and -ing forms of a regular verb.
+    """
+    if term.endswith("y") and term[-2:-1] not in VOWELS:
+        return [term[:-1] + "ies", term[:-1] + "ied", term + "ing"]
+    if term.endswith("e"):
+        return [term + "s", term + "d", term[:-1] + "ing"]
+    # one-syllable consonant-vowel-consonant verbs double: drop -> dropped
+    syllables = len(re.findall(f"[{VOWELS}]+", term))
+    if (
+        syllables == 1
+        and len(term) >= 3
+        and term[-1] not in VOWELS + "wxy"
+        and term[-2] in VOWELS
+        and term[-3] not in VOWELS
+    ):
+        return [plural(term), term + term[-1] + "ed", term + term[-1] + "ing"]
+    return [plural(term), term + "ed", term + "ing"]
+
+
+def adverb(term):
+    if term.endswith("y"):
+        return term[:-1] + "ily"
+    if term.endswith("le"):
+        return term[:-1] + "y"
+    if term.endswith("ic"):
+        return term + "ally"
+    return term + "ly"
+
+
+def inflect(term, pos=None):
+    """
+    Return the surface forms of a vocabulary term: the term itself plus, by
+    part of speech, its plural ("noun"), 3rd person / past / -ing forms
+    ("verb") or -ly adverb ("adj"). pos=None, multi-word and hyphenated terms
+    are matched verbatim; INFLECTION_EXCEPTIONS overrides the rules.
+    """
+    forms = {term}
+    if term in INFLECTION_EXCEPTIONS:
+        forms.update(INFLECTION_EXCEPTIONS[term])
+    elif not term.isalpha() or pos is None:
+        pass
+    elif pos == "verb":
+        forms.update(verb_forms(term))
+    elif pos == "noun":
+        forms.add(plural(term))
+    elif pos == "adj":
+        forms.add(adverb(term))
+    else:
+        raise ValueError(f"unknown part of speech: {pos}")
+    return forms
+
+
+def part_of_speech(term, vocab_name):
+    if vocab_name == "EVENT_VERBS" or term in DESCRIPTOR_VERBS:
+        return "verb"
+    if term in DESCRIPTOR_NOUNS:
+        return "noun"
+    if term in DESCRIPTOR_ADJECTIVES:
+        return "adj"
+    return None
+
+
+class LexicalMatcher:
+    """
+    Single-pass multi-vocabulary matcher.
+
+    All surface forms of all terms are compiled into one word-bounded regex.
+    A form that also contains other terms as whole words (e.g. "audio background"
+    contains "background", "buzzing" is both ACOUSTIC "buzzing" and EVENT "buzz")
+    credits every one of them, so the result does not depend on which
+    alternative the regex picks.
+    """
+
+    def __init__(self, vocabs):
+        # surface form -> set of (vocab_name, term)
+        owners = {}
+        for name, terms in vocabs.items():
+            for term in terms:
+                for form in inflect(term.lower(), pos=part_of_speech(term.lower(), name)):
+                    owners.setdefault(form, set()).add((name, term))
+
+        # credit terms whose forms occur as whole words inside longer forms
+        words = {form: re.compile(r"\b" + re.escape(form) + r"\b") for form in owners}
+        self.form_terms = {}
+        for form in owners:
+            hits = set()
+            for other, pattern in words.items():
+                if other == form or pattern.search(form):
+                    hits |= owners[other]
+            self.form_terms[form] = tuple(sorted(hits))
+
+        alternation = "|".join(
+            re.escape(form).replace(r"\ ", r"\s+")
+            for form in sorted(owners, key=len, reverse=True)
+        )
+        self.pattern = re.compile(r"\b(?:" + alternation + r")\b")
+        self.vocab_names = list(vocabs)
+
+    def count(self, text):
+        """
+        text: lower-cased caption
+        return: {vocab_name: Counter(term -> occurrences)}
+        """
+        counts = {name: Counter() for name in self.vocab_names}
+        for m in self.pattern.finditer(text):
+            form = re.sub(r"\s+", " ", m.group(0))
+            for name, term in self.form_terms[form]:
+                counts[name][term] += 1
+        return counts
+
+
+MATCHER = LexicalMatcher({
+    "EVENT_VERBS": EVENT_VERBS,
+    "DEFINITE_TERMS": DEFINITE_TERMS,
+    "ACOUSTIC_TERMS": ACOUSTIC_TERMS,
+})
+
+
+
+# columns read from a results file
+METRIC_COLUMNS = ["file_name", "hallucination_detected", "hallucination_types", "model_caption"]
+# long-format column of run_inference_NIC.py --sweep outputs (exemplar count)
+SWEEP_COLUMN = "k"
+
+# (result key, vocabulary name)
+LEXICAL_CATEGORIES = [
+    ("event", "EVENT_VERBS"),
+    ("definite", "DEFINITE_TERMS"),
+    ("acoustic", "ACOUSTIC_TERMS"),
+]
+
+
+def parse_hallucination_flag(h) -> bool:
+    if isinstance(h, str):
+        return h.strip().lower() in ["true", "1", "yes"]
+    return bool(h)
+
+
+def parse_hallucination_types(types_str) -> list:
+    if isinstance(types_str, list):
+        return types_str
+    types_str = (types_str or "").strip()
+    if not types_str:
+        return []
+    try:
+        types = json.loads(types_str)
+        if not isinstance(types, list):
+            types = [types]
+    except Exception:
+        types = []
+    return types
+
+
+def lexical_freqs(caption: str) -> Dict[str, float]:
+    """
+    Distinct vocabulary terms per token, for each lexical category.
+    """
+    caption_lc = caption.lower()
+    token_count = max(len(caption_lc.split()), 1)
+    matches = MATCHER.count(caption_lc)
+    return {
+        key: len(matches[vocab]) / token_count
+        for key, vocab in LEXICAL_CATEGORIES
+    }
+
+
+# =========================
+# Metrics
+# =========================
+@dataclass
+class HallucinationMetrics:
+    source: str
+    total: int = 0
+    hall_count: int = 0
+    type_counts_all: Dict[str, int] = field(default_factory=dict)
+    type_counts_hall: Dict[str, int] = field(default_factory=dict)
+    # "TYPE_A+TYPE_B" -> count, most common first
+    combo_counts: Dict[str, int] = field(default_factory=dict)
+    # mean lexical frequency over all / hallucinated samples
+    lexical_all: Dict[str, float] = field(default_factory=dict)
+    lexical_hall: Dict[str, float] = field(default_factory=dict)
+    # standard deviation of the per-sample lexical frequency
+    lexical_all_std: Dict[str, float] = field(default_factory=dict)
+    lexical_hall_std: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def hr(self) -> float:
+        return self.hall_count / self.total if self.total else 0.0
+
+    @property
+    def score(self) -> float:
+        return 100 * (1 - self.hr)
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d["hr"] = self.hr
+        d["score"] = self.score
+        return d
+
+    def to_json(self, path: Optional[str] = None) -> str:
+        text = json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        return text
+
+
+class RunningStats:
+    """
+    Welford running mean / variance; mergeable and JSON-serializable.
+    """
+
+    def __init__(self, n: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, x: float):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, other: "RunningStats"):
+        n = self.n + other.n
+        if n == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.n if self.n else 0.0
+
+    def to_dict(self) -> dict:
+        return {"n": self.n, "mean": self.mean, "m2": self.m2}
+
+
+# bytes hashed at each end of the consumed part of a CSV to detect a rewritten source
+PREFIX_PROBE = 1 << 16
+
+
+def source_prefix(path: str, offset: int) -> str:
+    """
+    Cheap fingerprint of the part of a results file consumed up to `offset`:
+    the first and last PREFIX_PROBE bytes before it (CSV), or the last
+    consumed row (Parquet, where offset counts rows).
+    """
+    h = hashlib.sha1(str(offset).encode())
+    if result_store.is_parquet(path):
+        if offset:
+            last = next(result_store.iter_parquet_rows(path, start=offset - 1, columns=METRIC_COLUMNS), {})
+            h.update(json.dumps(last, sort_keys=True, default=str).encode("utf-8"))
+        return h.hexdigest()
+    with open(path, "rb") as f:
+        h.update(f.read(min(offset, PREFIX_PROBE)))
+        f.seek(max(offset - PREFIX_PROBE, 0))
+        h.update(f.read(offset - f.tell()))
+    return h.hexdigest()
+
+
+class MetricsAccumulator:
+    """
+    Constant-memory metrics over a stream of evaluated rows.
+
+    State is a handful of counters and running moments, so it can be
+    checkpointed to JSON and later updated with only the rows appended
+    to a results CSV since the last checkpoint (tracked as a byte offset).
+    """
+
+    def __init__(self, source: str = ""):
+        self.source = source
+        # bytes of a CSV source (or rows of a Parquet source) already consumed
+        self.offset = 0
+        # source_prefix() of the consumed part, to detect a rewritten source
+        self.prefix = ""
+        self.total = 0
+        self.hall_count = 0
+        self.type_counts_all = Counter()
+        self.type_counts_hall = Counter()
+        self.combo_counts = Counter()
+        keys = [key for key, _ in LEXICAL_CATEGORIES]
+        self.lexical_all = {k: RunningStats() for k in keys}
+        self.lexical_hall = {k: RunningStats() for k in keys}
+
+    def update(self, row: dict):
+        self.total += 1
+
+        h_flag = parse_hallucination_flag(row.get("hallucination_detected", ""))
+        types = parse_hallucination_types(row.get("hallucination_types", ""))
+
+        if h_flag:
+            self.hall_count += 1
+
+        unique_types = set(t for t in types if t)
+        for t in unique_types:
+            self.type_counts_all[t] += 1
             if h_flag:
-                hall_count += 1
-
-            unique_types = set(t for t in types if t)
-            for t in unique_types:
-                type_counter_all[t] += 1
-                if h_flag:
-                    type_counter_hall[t] += 1
+                self.type_counts_hall[t] += 1
 
-            if unique_types:
-                combo_key = tuple(sorted(unique_types))
-                combo_counter[combo_key] += 1
-
-            caption = row.get("model_caption", "")
-
-            caption_lc = caption.lower()
-            tokens = caption_lc.split()
-            token_count = max(len(tokens), 1)  
-            event_cnt = count_matches(caption_lc, EVENT_VERBS)
-            def_cnt = count_matches(caption_lc, DEFINITE_TERMS)
-            acoustic_cnt = count_matches(caption_lc, ACOUSTIC_TERMS)
-
-            event_freq = event_cnt / token_count
-            def_freq = def_cnt / token_count
-            acoustic_freq = acoustic_cnt / token_count
-
-            event_freqs.append(event_freq)
-            def_freqs.append(def_freq)
-            acoustic_freqs.append(acoustic_freq)
+        if unique_types:
+            self.combo_counts["+".join(sorted(unique_types))] += 1
 
+        freqs = lexical_freqs(row.get("model_caption") or "")
+        for k, v in freqs.items():
+            self.lexical_all[k].update(v)
             if h_flag:
-                event_freqs_hall.append(event_freq)
-                def_freqs_hall.append(def_freq)
-                acoustic_freqs_hall.append(acoustic_freq)
-
-    # ==== 计算指标 ====
-    if total == 0:
+                self.lexical_hall[k].update(v)
+
+    def update_from_file(self, path: str) -> int:
+        """
+        Consume the rows of `path` not seen yet. Returns the number of new rows.
+        """
+        parquet = result_store.is_parquet(path)
+        if self.offset:
+            if not parquet and os.path.getsize(path) < self.offset:
+                raise ValueError(f"{path} is shorter than the checkpointed offset; rebuild the summary")
+            if self.prefix and source_prefix(path, self.offset) != self.prefix:
+                raise ValueError(f"{path} was rewritten since the checkpoint; rebuild the summary")
+            if not parquet and os.path.getsize(path) > self.offset:
+                with open(path, "rb") as f:
+                    f.seek(self.offset - 1)
+                    if f.read(1) != b"\n":
+                        raise ValueError(f"the last record of {path} was extended since the checkpoint; "
+                                         f"rebuild the summary")
+
+        new_rows = 0
+        if parquet:
+            for row in result_store.iter_parquet_rows(path, start=self.offset, columns=METRIC_COLUMNS):
+                self.update(row)
+                self.offset += 1
+                new_rows += 1
+        else:
+            for row, end in result_store.iter_csv_records(path, self.offset, columns=METRIC_COLUMNS):
+                self.update(row)
+                self.offset = end
+                new_rows += 1
+        self.prefix = source_prefix(path, self.offset)
+        return new_rows
+
+    def merge(self, other: "MetricsAccumulator"):
+        self.total += other.total
+        self.hall_count += other.hall_count
+        self.type_counts_all.update(other.type_counts_all)
+        self.type_counts_hall.update(other.type_counts_hall)
+        self.combo_counts.update(other.combo_counts)
+        for k in self.lexical_all:
+            self.lexical_all[k].merge(other.lexical_all[k])
+            self.lexical_hall[k].merge(other.lexical_hall[k])
+
+    def result(self) -> HallucinationMetrics:
+        return HallucinationMetrics(
+            source=self.source,
+            total=self.total,
+            hall_count=self.hall_count,
+            type_counts_all=dict(self.type_counts_all),
+            type_counts_hall=dict(self.type_counts_hall),
+            combo_counts=dict(self.combo_counts.most_common()),
+            lexical_all={k: s.mean for k, s in self.lexical_all.items()},
+            lexical_hall={k: s.mean for k, s in self.lexical_hall.items()},
+            lexical_all_std={k: s.variance ** 0.5 for k, s in self.lexical_all.items()},
+            lexical_hall_std={k: s.variance ** 0.5 for k, s in self.lexical_hall.items()},
+        )
+
+    def state_dict(self) -> dict:
+        return {
+            "source": self.source,
+            "offset": self.offset,
+            "prefix": self.prefix,
+            "total": self.total,
+            "hall_count": self.hall_count,
+            "type_counts_all": dict(self.type_counts_all),
+            "type_counts_hall": dict(self.type_counts_hall),
+            "combo_counts": dict(self.combo_counts),
+            "lexical_all": {k: s.to_dict() for k, s in self.lexical_all.items()},
+            "lexical_hall": {k: s.to_dict() for k, s in self.lexical_hall.items()},
+        }
+
+    @classmethod
+    def from_state_dict(cls, state: dict) -> "MetricsAccumulator":
+        acc = cls(state.get("source", ""))
+        acc.offset = state["offset"]
+        acc.prefix = state.get("prefix", "")
+        acc.total = state["total"]
+        acc.hall_count = state["hall_count"]
+        acc.type_counts_all = Counter(state["type_counts_all"])
+        acc.type_counts_hall = Counter(state["type_counts_hall"])
+        acc.combo_counts = Counter(state["combo_counts"])
+        acc.lexical_all = {k: RunningStats(**v) for k, v in state["lexical_all"].items()}
+        acc.lexical_hall = {k: RunningStats(**v) for k, v in state["lexical_hall"].items()}
+        return acc
+
+    def save(self, path: str):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "MetricsAccumulator":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_state_dict(json.load(f))
+
+
+def compute_metrics(csv_path: str) -> HallucinationMetrics:
+    """
+    Compute hallucination and lexical metrics for one evaluated results file
+    (CSV or Parquet). Holds no state between calls.
+    """
+    acc = MetricsAccumulator(csv_path)
+    acc.update_from_file(csv_path)
+    return acc.result()
+
+
+def update_summary(csv_path: str, summary_path: str) -> HallucinationMetrics:
+    """
+    Incrementally update a checkpointed summary with rows appended to csv_path.
+    """
+    if os.path.exists(summary_path):
+        acc = MetricsAccumulator.load(summary_path)
+        if acc.source and os.path.abspath(acc.source) != os.path.abspath(csv_path):
+            raise ValueError(f"{summary_path} summarizes {acc.source}, not {csv_path}")
+    else:
+        acc = MetricsAccumulator(csv_path)
+    acc.source = csv_path
+    acc.update_from_file(csv_path)
+    acc.save(summary_path)
+    return acc.result()
+
+
+def compute_metrics_by(csv_path: str, column: str = SWEEP_COLUMN) -> Dict[str, HallucinationMetrics]:
+    """
+    Metrics per value of `column` in one results file (e.g. HR by k for a
+    --sweep run), ordered by value, numerically when every value is a number.
+    """
+    accs: Dict[str, MetricsAccumulator] = {}
+    for row in result_store.iter_rows(csv_path, columns=METRIC_COLUMNS + [column]):
+        value = str(row.get(column, ""))
+        if value not in accs:
+            accs[value] = MetricsAccumulator(f"{csv_path}[{column}={value}]")
+        accs[value].update(row)
+
+    values = list(accs)
+    try:
+        values.sort(key=float)
+    except ValueError:
+        values.sort()
+    return {v: accs[v].result() for v in values}
+
+
+def print_report(m: HallucinationMetrics):
+    if m.total == 0:
         print("No samples found.")
         return
 
-    hr = hall_count / total  # Hallucination Rate
-    score = 100 * (1 - hr)   
-
     print("========== Hallucination Evaluation ==========")
-    print(f"Total samples            : {total}")
-    print(f"Hallucinated samples     : {hall_count}")
-    print(f"Hallucination Rate (HR)  : {hr:.4f}")
-    print(f"Non-hallucination Score  : {score:.2f} / 100")
+    print(f"Total samples            : {m.total}")
+    print(f"Hallucinated samples     : {m.hall_count}")
+    print(f"Hallucination Rate (HR)  : {m.hr:.4f}")
+    print(f"Non-hallucination Score  : {m.score:.2f} / 100")
     print()
 
     print("---- Type occurrence over ALL samples ----")
-    for t, c in type_counter_all.items():
-        print(f"{t:18s}: {c:5d} ({c/total:.4f})")
+    for t, c in m.type_counts_all.items():
+        print(f"{t:18s}: {c:5d} ({c/m.total:.4f})")
 
     print()
 
-    if hall_count > 0:
+    if m.hall_count > 0:
         print("---- Type occurrence among HALLUCINATED samples ----")
-        for t, c in type_counter_hall.items():
-            print(f"{t:18s}: {c:5d} ({c/hall_count:.4f})")
+        for t, c in m.type_counts_hall.items():
+            print(f"{t:18s}: {c:5d} ({c/m.hall_count:.4f})")
         print()
     else:
         print("No hallucinations detected; type breakdown is empty.")
         print()
 
-    if combo_counter:
+    if m.combo_counts:
         print("---- Type combination distribution ----")
-        for combo, c in combo_counter.most_common():
-            print(f"{list(combo)} : {c}")
+        for combo, c in m.combo_counts.items():
+            print(f"{combo.split('+')} : {c}")
     print("=============================================")
 
-
-    def mean(xs):
-        return sum(xs) / len(xs) if xs else 0.0
-
     print("========== Lexical Commitment Analysis ==========")
-    print(f"Event-level verbs freq      : {mean(event_freqs):.4f}")
-    print(f"Definite commitments freq   : {mean(def_freqs):.4f}")
-    print(f"Acoustic descriptors freq   : {mean(acoustic_freqs):.4f}")
+    print(f"Event-level verbs freq      : {m.lexical_all['event']:.4f}")
+    print(f"Definite commitments freq   : {m.lexical_all['definite']:.4f}")
+    print(f"Acoustic descriptors freq   : {m.lexical_all['acoustic']:.4f}")
     print()
 
-    if event_freqs_hall:
+    if m.hall_count > 0:
         print("---- Among hallucinated samples ----")
-        print(f"Event-level verbs freq      : {mean(event_freqs_hall):.4f}")
-        print(f"Definite commitments freq   : {mean(def_freqs_hall):.4f}")
-        print(f"Acoustic descriptors freq   : {mean(acoustic_freqs_hall):.4f}")
+        print(f"Event-level verbs freq      : {m.lexical_hall['event']:.4f}")
+        print(f"Definite commitments freq   : {m.lexical_hall['definite']:.4f}")
+        print(f"Acoustic descriptors freq   : {m.lexical_hall['acoustic']:.4f}")
+
+
+def evaluate_hallucination(csv_path: str) -> HallucinationMetrics:
+    metrics = compute_metrics(csv_path)
+    print_report(metrics)
+    return metrics
+
+
+# =========================
+# Multi-run comparison
+# =========================
+def compare_runs(csv_paths: List[str], max_workers: Optional[int] = None) -> List[HallucinationMetrics]:
+    """
+    Compute metrics for many results CSVs in parallel worker processes.
+    Results are returned in the order of csv_paths.
+    """
+    if len(csv_paths) == 1:
+        return [compute_metrics(csv_paths[0])]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(compute_metrics, csv_paths))
+
+
+def comparison_rows(results: List[HallucinationMetrics]) -> List[dict]:
+    types = sorted({t for m in results for t in m.type_counts_all})
+    rows = []
+    for m in results:
+        row = {
+            "run": os.path.basename(m.source),
+            "total": m.total,
+            "hall_count": m.hall_count,
+            "hr": round(m.hr, 4),
+        }
+        for t in types:
+            row[t] = round(m.type_counts_all.get(t, 0) / m.total, 4) if m.total else 0.0
+        for key, _ in LEXICAL_CATEGORIES:
+            row[f"{key}_freq"] = round(m.lexical_all.get(key, 0.0), 4)
+        rows.append(row)
+    return rows
+
+
+def grouped_rows(by: Dict[str, HallucinationMetrics], column: str = SWEEP_COLUMN) -> List[dict]:
+    """
+    comparison_rows keyed by group value instead of run, plus the HR change from the first group.
+    """
+    rows = []
+    base = next(iter(by.values())).hr if by else 0.0
+    for (value, m), row in zip(by.items(), comparison_rows(list(by.values()))):
+        row.pop("run")
+        rows.append({column: value, **row, "hr_diff": round(m.hr - base, 4) + 0.0})
+    return rows
+
+
+def format_table(rows: List[dict]) -> str:
+    if not rows:
+        return ""
+    cols = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    lines = ["  ".join(c.ljust(widths[c]) for c in cols)]
+    lines.append("  ".join("-" * widths[c] for c in cols))
+    for r in rows:
+        lines.append("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hallucination metrics for evaluated results files (CSV or Parquet).")
+    parser.add_argument("csv_paths", nargs="*", default=[EVAL_CSV])
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for multiple CSVs")
+    parser.add_argument("--json-dir", default="", help="write one <run>.metrics.json per CSV here")
+    parser.add_argument("--table-csv", default="", help="write the comparison table to this CSV")
+    parser.add_argument("--summary", default="",
+                        help="checkpoint file for one CSV; only rows appended since the last run are read")
+    args = parser.parse_args()
+
+    if args.summary:
+        if len(args.csv_paths) != 1:
+            parser.error("--summary takes exactly one results file")
+        results = [update_summary(args.csv_paths[0], args.summary)]
+    else:
+        results = compare_runs(args.csv_paths, max_workers=args.workers)
+
+    # a single --sweep output is reported by k instead of as one pooled run
+    by_k = None
+    if len(args.csv_paths) == 1 and SWEEP_COLUMN in result_store.read_fieldnames(args.csv_paths[0]):
+        by_k = compute_metrics_by(args.csv_paths[0], SWEEP_COLUMN)
+
+    if by_k:
+        print(format_table(grouped_rows(by_k, SWEEP_COLUMN)))
+    elif len(results) == 1:
+        print_report(results[0])
+    else:
+        print(format_table(comparison_rows(results)))
+
+    if args.json_dir:
+        os.makedirs(args.json_dir, exist_ok=True)
+        for m in results:
+            name = os.path.splitext(os.path.basename(m.source))[0]
+            m.to_json(os.path.join(args.json_dir, f"{name}.metrics.json"))
+
+    if args.table_csv:
+        rows = grouped_rows(by_k, SWEEP_COLUMN) if by_k else comparison_rows(results)
+        with open(args.table_csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
 
 
 if __name__ == "__main__":
-    evaluate_hallucination(EVAL_CSV)
+    main()
@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+from dataclasses import asdict
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import torch
+
+import audio_io
+import noise_retrieval as noise_retrieval
+
+
+# =========================
+# Config
+# =========================
+HOST = "127.0.0.1"
+PORT = 8765
+SERVICE_URL = f"http://{HOST}:{PORT}"
+
+BEATS_CKPT = "checkpoints/BEATs_iter3_plus_AS2M_finetuned_on_AS2M_cpt2.pt"
+NOISE_LIST = "data/noise_list.json"
+NOISE_EMB_STORE = "checkpoints/noise_kb_embeddings.npz"
+
+# queries encoded per forward, and how long the first query of a batch waits for company
+MAX_BATCH = noise_retrieval.ENCODE_BATCH_SIZE
+MAX_WAIT_MS = 10.0
+
+CLIENT_TIMEOUT = 300.0
+
+
+# =========================
+# Dynamic micro-batching
+# =========================
+class MicroBatcher:
+    """
+    Collects query waveforms submitted from many request threads and encodes
+    them together: a batch closes when it holds max_batch clips or when its
+    first clip has waited max_wait_ms.
+    """
+
+    def __init__(self, kb: noise_retrieval.NoiseKnowledgeBase, max_batch: int = MAX_BATCH,
+                 max_wait_ms: float = MAX_WAIT_MS):
+        self.kb = kb
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue: "queue.Queue[tuple]" = queue.Queue()
+        self.batches = 0
+        self.clips = 0
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, wav: torch.Tensor) -> Future:
+        future = Future()
+        self.queue.put((wav, future))
+        return future
+
+    def encode(self, wavs: List[torch.Tensor]) -> torch.Tensor:
+        """
+        (B, D) query embeddings, encoded alongside concurrent requests.
+        """
+        futures = [self.submit(w) for w in wavs]
+        return torch.stack([f.result() for f in futures], dim=0)
+
+    def _loop(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._run(batch)
+
+    def _run(self, batch: List[tuple]):
+        try:
+            embs = self.kb.encode_queries([wav for wav, _ in batch], batch_size=self.max_batch)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.clips += len(batch)
+        for (_, future), emb in zip(batch, embs):
+            future.set_result(emb)
+
+
+# =========================
+# HTTP server
+# =========================
+class EmbeddingHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health                               -> {"fingerprint", "version", "kb_size", "query_policy",
+                                                   "prefilter", "batches", "clips"}
+    POST /encode   {"paths"}                   -> {"embeddings": [[...], ...]}
+    POST /retrieve {"paths", "topk"}           -> {"results": [[{index, audio_path, caption, similarity}, ...], ...]}
+    POST /search   {"embeddings", "topk"}      -> {"results": ...}
+    Paths are read on the server, so they must be valid there (clients send absolute paths).
+    """
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._reply(404, {"error": f"unknown endpoint {self.path}"})
+        batcher = self.server.batcher
+        self._reply(200, dict(self.server.info, batches=batcher.batches, clips=batcher.clips))
+
+    def do_POST(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            kb, batcher = self.server.kb, self.server.batcher
+            topk = int(body.get("topk", 3))
+
+            if self.path == "/search":
+                embs = torch.tensor(body["embeddings"], dtype=torch.float32)
+            elif self.path in ("/encode", "/retrieve"):
+                # decode in the request thread; only the encoder is shared
+                wavs = audio_io.load_many(body["paths"])
+                if self.path == "/retrieve":
+                    results = kb.retrieve_wavs(wavs, topk=topk, encode=batcher.encode) if wavs else []
+                    return self._reply(200, {"results": results})
+                return self._reply(200, {"embeddings": batcher.encode(wavs).tolist() if wavs else []})
+            else:
+                return self._reply(404, {"error": f"unknown endpoint {self.path}"})
+
+            if embs.shape[0] == 0:
+                return self._reply(200, {"results": []})
+            sims, idxs = kb.search(embs, topk)
+            self._reply(200, {"results": [kb.format_results(s, i) for s, i in zip(sims, idxs)]})
+        except Exception as e:
+            self._reply(400, {"error": f"{type(e).__name__}: {e}"})
+
+    def _reply(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def service_info(kb: noise_retrieval.NoiseKnowledgeBase) -> Dict:
+    """
+    The KB's identity and retrieval settings, as reported by /health.
+    """
+    return {
+        "fingerprint": kb.fingerprint,
+        "version": kb.version,
+        "kb_size": len(kb),
+        "query_policy": asdict(kb.query_policy),
+        "prefilter": kb.prefilter.params if kb.prefilter is not None else None,
+    }
+
+
+def make_server(kb: noise_retrieval.NoiseKnowledgeBase, host: str = HOST, port: int = PORT,
+                max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), EmbeddingHandler)
+    server.daemon_threads = True
+    server.kb = kb
+    # the KB does not change while serving; its version hashes every exemplar, so once
+    server.info = service_info(kb)
+    server.batcher = MicroBatcher(kb, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    return server
+
+
+def serve(kb: noise_retrieval.NoiseKnowledgeBase, host: str = HOST, port: int = PORT,
+          max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+    server = make_server(kb, host=host, port=port, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    print(f"serving {len(kb)} noise exemplars on http://{host}:{port}")
+    server.serve_forever()
+
+
+# =========================
+# Client
+# =========================
+class EmbeddingClient:
+    """
+    Drop-in for NoiseKnowledgeBase.retrieve / retrieve_batch backed by a running service.
+    query_policy / prefilter: the retrieval settings the caller expects; a
+    service configured otherwise raises ValueError instead of silently
+    retrieving differently. None skips the check.
+    """
+
+    def __init__(self, url: str = SERVICE_URL, timeout: float = CLIENT_TIMEOUT,
+                 query_policy: Optional[noise_retrieval.QueryPolicy] = None, prefilter: Optional[bool] = None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        health = self.health()
+        self.fingerprint = health["fingerprint"]
+        self.version = health["version"]
+        served_policy = noise_retrieval.QueryPolicy(**health["query_policy"])
+        if query_policy is not None and served_policy.identity() != query_policy.identity():
+            raise ValueError(
+                f"{self.url} embeds queries with {served_policy.identity()}, not {query_policy.identity()};"
+                " restart it with --query-policy"
+            )
+        if prefilter is not None and (health["prefilter"] is not None) != prefilter:
+            raise ValueError(
+                f"{self.url} runs {'with' if health['prefilter'] is not None else 'without'} the spectral"
+                " pre-filter; restart it with the matching --prefilter setting"
+            )
+
+    def _request(self, endpoint: str, payload: Optional[Dict] = None) -> Dict:
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        req = urllib.request.Request(self.url + endpoint, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(json.loads(e.read()).get("error", str(e))) from None
+
+    def health(self) -> Dict:
+        return self._request("/health")
+
+    def encode(self, audio_paths: List[str]) -> torch.Tensor:
+        out = self._request("/encode", {"paths": [os.path.abspath(p) for p in audio_paths]})
+        return torch.tensor(out["embeddings"], dtype=torch.float32)
+
+    def retrieve_batch(self, query_audio_paths: List[str], topk: int = 3) -> List[List[Dict]]:
+        out = self._request("/retrieve", {"paths": [os.path.abspath(p) for p in query_audio_paths], "topk": topk})
+        return out["results"]
+
+    def retrieve(self, query_audio_path: Optional[str] = None, topk: int = 3,
+                 query_embedding: Optional[torch.Tensor] = None) -> List[Dict]:
+        if query_embedding is not None:
+            out = self._request("/search", {"embeddings": [query_embedding.tolist()], "topk": topk})
+            return out["results"][0]
+        return self.retrieve_batch([query_audio_path], topk=topk)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve BEATs query encoding and noise retrieval over localhost HTTP.")
+    parser.add_argument("--ckpt", default=BEATS_CKPT)
+    parser.add_argument("--noise-list", default=NOISE_LIST, help='JSON list of {"audio_path", "caption"}')
+    parser.add_argument("--store", default=NOISE_EMB_STORE, help='exemplar embedding store ("" = none)')
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--layer", type=int, default=None)
+    parser.add_argument("--precision", choices=noise_retrieval.PRECISIONS, default="fp32")
+    parser.add_argument("--chunk-seconds", type=float, default=None,
+                        help="encode clips longer than this as overlapping windows (default: whole clips)")
+    parser.add_argument("--chunk-hop-seconds", type=float, default=noise_retrieval.CHUNK_HOP_SECONDS)
+    parser.add_argument("--shard", default="", help="decoded-audio shard prefix (build_audio_shard.py)")
+    parser.add_argument("--query-policy", type=json.loads, default={},
+                        help='QueryPolicy fields as JSON, e.g. \'{"mode": "crops", "n_crops": 3}\' (default: full clip)')
+    parser.add_argument("--prefilter", action="store_true", help="spectral pre-filter tier in front of BEATs")
+    args = parser.parse_args()
+
+    if args.shard:
+        audio_io.open_shard(args.shard)
+    with open(args.noise_list, "r", encoding="utf-8") as f:
+        noise_list = json.load(f)
+    kb = noise_retrieval.NoiseKnowledgeBase(
+        args.ckpt, store_path=args.store or None, query_policy=noise_retrieval.QueryPolicy(**args.query_policy),
+        layer=args.layer, precision=args.precision,
+        chunk_seconds=args.chunk_seconds, chunk_hop_seconds=args.chunk_hop_seconds,
+    )
+    kb.build_from_list(noise_list)
+    if args.prefilter:
+        kb.enable_prefilter()
+    serve(kb, host=args.host, port=args.port, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import os
+import csv
+import time
+import argparse
+import torch
+from typing import List
+
+import calculate as calc
+import noise_retrieval as noise_retrieval
+import spectral_prefilter
+
+
+META_CSV = "data/data.csv"
+AUDIO_ROOT = "data/clotho"
+BEATS_CKPT = "checkpoints/BEATs_iter3_plus_AS2M_finetuned_on_AS2M_cpt2.pt"
+
+
+# =========================
+# Helpers
+# =========================
+def clip_paths(meta_csv: str, audio_root: str, limit: int) -> List[str]:
+    with open(meta_csv, "r", encoding="utf-8") as f:
+        names = list(dict.fromkeys(row["file_name"] for row in csv.DictReader(f)))
+    paths = [os.path.join(audio_root, n) for n in names]
+    paths = [p for p in paths if os.path.exists(p)]
+    return paths[:limit] if limit else paths
+
+
+def cosine(a: torch.Tensor, b: torch.Tensor) -> torch.Tensor:
+    return torch.nn.functional.cosine_similarity(a, b, dim=-1)
+
+
+def attention_bytes(encoder: noise_retrieval.BEATsEncoder, num_samples: int, batch: int = 1) -> int:
+    """
+    Size of one layer's fp32 attention matrix for a clip of num_samples.
+    """
+    patch = encoder.model.input_patch_size
+    frames = 1 + (num_samples - noise_retrieval.FBANK_WIN) // noise_retrieval.FBANK_HOP
+    tokens = (frames // patch) * (128 // patch)
+    heads = encoder.model.cfg.encoder_attention_heads
+    return batch * heads * tokens * tokens * 4
+
+
+def timed(fn, *args, **kwargs):
+    t = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t
+
+
+# =========================
+# Chunked vs full-clip encoding
+# =========================
+def bench_chunked(args):
+    encoder = noise_retrieval.BEATsEncoder(args.ckpt)
+    paths = clip_paths(args.meta, args.audio_root, args.limit)
+
+    sims, t_full, t_chunk = [], 0.0, 0.0
+    longest = 0
+    for path in paths:
+        wav = noise_retrieval.load_audio(path)
+        longest = max(longest, wav.shape[-1])
+        full, dt = timed(encoder.encode_batch, [wav])
+        t_full += dt
+        chunked, dt = timed(encoder.encode_chunked, wav, args.chunk_seconds, args.hop_seconds)
+        t_chunk += dt
+        sims.append(cosine(full[0], chunked).item())
+
+    sims = torch.tensor(sims)
+    win = int(args.chunk_seconds * noise_retrieval.SAMPLE_RATE)
+    print(f"clips                  : {len(paths)}")
+    print(f"window / hop           : {args.chunk_seconds}s / {args.hop_seconds}s")
+    print(f"cosine(full, chunked)  : mean={sims.mean():.4f} min={sims.min():.4f}")
+    print(f"encode time            : full={t_full:.2f}s chunked={t_chunk:.2f}s")
+    print(f"attention matrix/layer : full(longest)={attention_bytes(encoder, longest) / 2**20:.1f} MiB "
+          f"chunked={attention_bytes(encoder, win, noise_retrieval.ENCODE_BATCH_SIZE) / 2**20:.1f} MiB")
+
+
+# =========================
+# Retrieval agreement helpers
+# =========================
+def noise_list(noise_dir: str = "data/noise") -> List[dict]:
+    return [
+        {"audio_path": os.path.join(noise_dir, n), "caption": n}
+        for n in sorted(os.listdir(noise_dir)) if n.endswith(".wav")
+    ]
+
+
+def topk_overlap(a: torch.Tensor, b: torch.Tensor) -> float:
+    """
+    Mean fraction of shared indices between two (B, k) top-k index matrices.
+    """
+    k = a.shape[1]
+    return sum(len(set(x.tolist()) & set(y.tolist())) for x, y in zip(a, b)) / (a.shape[0] * k)
+
+
+# =========================
+# Crop-sampled vs full-clip queries
+# =========================
+def bench_crops(args):
+    kb = noise_retrieval.NoiseKnowledgeBase(args.ckpt)
+    kb.build_from_list(noise_list())
+    wavs = [noise_retrieval.load_audio(p) for p in clip_paths(args.meta, args.audio_root, args.limit)]
+
+    kb.query_policy = noise_retrieval.QueryPolicy(mode="full")
+    full, t_full = timed(kb.encode_queries, wavs)
+    kb.query_policy = noise_retrieval.QueryPolicy(
+        mode="crops", n_crops=args.n_crops, crop_seconds=args.crop_seconds, select=args.select
+    )
+    crops, t_crops = timed(kb.encode_queries, wavs)
+
+    _, idx_full = kb.search(full, args.k)
+    _, idx_crops = kb.search(crops, args.k)
+    print(f"clips               : {len(wavs)}")
+    print(f"policy              : {args.n_crops} x {args.crop_seconds}s crops, {args.select}")
+    print(f"top-{args.k} overlap        : {topk_overlap(idx_full, idx_crops):.4f}")
+    print(f"top-1 agreement     : {(idx_full[:, 0] == idx_crops[:, 0]).float().mean():.4f}")
+    print(f"cosine(full, crops) : {cosine(full, crops).mean():.4f}")
+    print(f"encode time         : full={t_full:.2f}s crops={t_crops:.2f}s ({t_full / max(t_crops, 1e-9):.1f}x)")
+
+
+# =========================
+# Early-exit layers
+# =========================
+def bench_layers(args):
+    encoder = noise_retrieval.BEATsEncoder(args.ckpt)
+    n_layers = len(encoder.model.encoder.layers)
+    layers = args.layers or list(range(n_layers))
+    noise_wavs = [noise_retrieval.load_audio(item["audio_path"]) for item in noise_list()]
+    query_wavs = [noise_retrieval.load_audio(p) for p in clip_paths(args.meta, args.audio_root, args.limit)]
+
+    def run(layer):
+        encoder.layer = layer
+        kb = noise_retrieval.l2_normalize(encoder.encode_many(noise_wavs))
+        queries, dt = timed(encoder.encode_many, query_wavs)
+        k = min(args.k, kb.shape[0])
+        return torch.topk(noise_retrieval.l2_normalize(queries) @ kb.T, k=k, dim=-1).indices, dt
+
+    ref_idx, ref_time = run(None)
+    rows = []
+    for layer in layers:
+        idx, dt = run(layer)
+        rows.append({
+            "layer": layer,
+            "layers_run": layer + 1,
+            f"top{args.k}_overlap": round(topk_overlap(ref_idx, idx), 4),
+            f"top{args.k}_exact": round(sum(set(a.tolist()) == set(b.tolist()) for a, b in zip(ref_idx, idx)) / len(idx), 4),
+            "top1_agree": round((ref_idx[:, 0] == idx[:, 0]).float().mean().item(), 4),
+            "query_s": round(dt, 2),
+            "speedup": round(ref_time / max(dt, 1e-9), 2),
+        })
+    print(f"clips={len(query_wavs)} kb={len(noise_wavs)} all {n_layers} layers: {ref_time:.2f}s")
+    print(calc.format_table(rows))
+
+
+# =========================
+# Reduced precision / int8
+# =========================
+def bench_precision(args):
+    noise_wavs = [noise_retrieval.load_audio(item["audio_path"]) for item in noise_list()]
+    query_wavs = [noise_retrieval.load_audio(p) for p in clip_paths(args.meta, args.audio_root, args.limit)]
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    def run(precision):
+        encoder = noise_retrieval.BEATsEncoder(args.ckpt, precision=precision)
+        kb = encoder.encode_many(noise_wavs)
+        encoder.encode_many(query_wavs[:1])  # warmup
+        queries, dt = timed(encoder.encode_many, query_wavs)
+        return kb, queries, dt
+
+    ref_kb, ref_q, ref_time = run("fp32")
+    k = min(args.k, ref_kb.shape[0])
+    search = lambda kb, q: torch.topk(noise_retrieval.l2_normalize(q) @ noise_retrieval.l2_normalize(kb).T, k=k, dim=-1).indices
+    ref_idx = search(ref_kb, ref_q)
+
+    rows = []
+    for precision in args.precisions:
+        kb, queries, dt = run(precision)
+        drift = 1 - cosine(ref_q, queries)
+        idx = search(kb, queries)
+        rows.append({
+            "precision": precision,
+            "drift_mean": f"{drift.mean():.2e}",
+            "drift_max": f"{drift.max():.2e}",
+            f"top{k}_overlap": round(topk_overlap(ref_idx, idx), 4),
+            "top1_agree": round((ref_idx[:, 0] == idx[:, 0]).float().mean().item(), 4),
+            "clips_per_s": round(len(query_wavs) / max(dt, 1e-9), 2),
+            "speedup": round(ref_time / max(dt, 1e-9), 2),
+        })
+    print(f"clips={len(query_wavs)} kb={ref_kb.shape[0]} threads={torch.get_num_threads()}")
+    print(calc.format_table(rows))
+
+
+# =========================
+# Compiled vs eager
+# =========================
+def bench_compile(args):
+    wavs = [noise_retrieval.load_audio(p) for p in clip_paths(args.meta, args.audio_root, args.limit)]
+    eager = noise_retrieval.BEATsEncoder(args.ckpt)
+    compiled = noise_retrieval.BEATsEncoder(args.ckpt, compiled=True, length_buckets=args.buckets)
+
+    _, t_warmup = timed(compiled.warmup)
+    ref, t_eager = timed(eager.encode_many, wavs)
+    out, t_compiled = timed(compiled.encode_many, wavs)
+
+    longest = max(w.shape[-1] for w in wavs) / noise_retrieval.SAMPLE_RATE
+    print(f"clips              : {len(wavs)} (longest {longest:.1f}s, buckets {args.buckets})")
+    print(f"warmup             : {t_warmup:.1f}s")
+    print(f"max |eager - comp| : {(ref - out).abs().max():.2e}")
+    print(f"cosine(eager, comp): min={cosine(ref, out).min():.6f}")
+    print(f"encode time        : eager={t_eager:.2f}s compiled={t_compiled:.2f}s ({t_eager / max(t_compiled, 1e-9):.2f}x)")
+
+
+# =========================
+# Spectral pre-filter tier
+# =========================
+def bench_prefilter(args):
+    kb = noise_retrieval.NoiseKnowledgeBase(args.ckpt)
+    kb.build_from_list(noise_list())
+    paths = clip_paths(args.meta, args.audio_root, args.limit)
+
+    ref, t_beats = timed(kb.retrieve_batch, paths, args.k)
+    prefilter = spectral_prefilter.SpectralPrefilter(
+        skip_distance=args.skip_distance, confident_distance=args.confident_distance,
+        confident_margin=args.confident_margin, shortlist=args.shortlist, skip_empty=args.skip_empty,
+    )
+    kb.enable_prefilter(prefilter)
+    tiered, t_tiered = timed(kb.retrieve_batch, paths, args.k)
+
+    rows = []
+    for decision in (spectral_prefilter.SKIP, spectral_prefilter.CONFIDENT, spectral_prefilter.AMBIGUOUS):
+        pairs = [
+            (r, t) for r, t, p in zip(ref, tiered, paths)
+            if prefilter.classify(noise_retrieval.load_audio(p))[0] == decision
+        ]
+        top1 = [bool(t) and t[0]["audio_path"] == r[0]["audio_path"] for r, t in pairs]
+        overlap = [len({x["audio_path"] for x in r} & {x["audio_path"] for x in t}) / len(r) for r, t in pairs]
+        rows.append({
+            "decision": decision,
+            "clips": len(pairs),
+            "share": round(len(pairs) / max(len(paths), 1), 4),
+            "top1_agree": round(sum(top1) / len(pairs), 4) if pairs else "",
+            f"top{args.k}_overlap": round(sum(overlap) / len(pairs), 4) if pairs else "",
+            "beats_max_sim": round(max(r[0]["similarity"] for r, _ in pairs), 4) if pairs else "",
+        })
+    print(f"clips={len(paths)} kb={len(kb)}  BEATs only: {t_beats:.2f}s  tiered: {t_tiered:.2f}s "
+          f"({t_beats / max(t_tiered, 1e-9):.1f}x)")
+    print(calc.format_table(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BEATs encoder speed / agreement benchmarks.")
+    parser.add_argument("--ckpt", default=BEATS_CKPT)
+    parser.add_argument("--meta", default=META_CSV)
+    parser.add_argument("--audio-root", default=AUDIO_ROOT)
+    parser.add_argument("--limit", type=int, default=100, help="number of clips (0 = all)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("chunked", help="chunked vs full-clip embeddings")
+    p.add_argument("--chunk-seconds", type=float, default=noise_retrieval.CHUNK_SECONDS)
+    p.add_argument("--hop-seconds", type=float, default=noise_retrieval.CHUNK_HOP_SECONDS)
+    p.set_defaults(fn=bench_chunked)
+
+    p = sub.add_parser("crops", help="crop-sampled vs full-clip query retrieval")
+    p.add_argument("--n-crops", type=int, default=3)
+    p.add_argument("--crop-seconds", type=float, default=2.0)
+    p.add_argument("--select", choices=["energy", "uniform"], default="energy")
+    p.add_argument("--k", type=int, default=4)
+    p.set_defaults(fn=bench_crops)
+
+    p = sub.add_parser("layers", help="early-exit layer vs full-depth retrieval")
+    p.add_argument("--layers", type=int, nargs="*", default=None, help="0-based layers (default: all)")
+    p.add_argument("--k", type=int, default=4)
+    p.set_defaults(fn=bench_layers)
+
+    p = sub.add_parser("precision", help="bf16 / int8 vs fp32 embeddings and retrieval")
+    p.add_argument("--precisions", nargs="+", choices=noise_retrieval.PRECISIONS, default=["fp32", "bf16", "int8"])
+    p.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = default)")
+    p.add_argument("--k", type=int, default=4)
+    p.set_defaults(fn=bench_precision)
+
+    p = sub.add_parser("compile", help="torch.compile'd vs eager encoder")
+    p.add_argument("--buckets", type=float, nargs="+", default=list(noise_retrieval.LENGTH_BUCKETS),
+                   help="length buckets in seconds")
+    p.set_defaults(fn=bench_compile)
+
+    p = sub.add_parser("prefilter", help="spectral pre-filter tier vs BEATs-only retrieval")
+    p.add_argument("--skip-distance", type=float, default=spectral_prefilter.SKIP_DISTANCE)
+    p.add_argument("--confident-distance", type=float, default=spectral_prefilter.CONFIDENT_DISTANCE)
+    p.add_argument("--confident-margin", type=float, default=spectral_prefilter.CONFIDENT_MARGIN)
+    p.add_argument("--shortlist", type=int, default=spectral_prefilter.SHORTLIST)
+    p.add_argument("--skip-empty", action="store_true", help="SKIP clips get zero exemplars instead of BEATs")
+    p.add_argument("--k", type=int, default=4)
+    p.set_defaults(fn=bench_prefilter)
+
+    args = parser.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
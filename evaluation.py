@@ -1,6 +1,7 @@
 import csv, json, time, os
 from openai import OpenAI
 from tqdm import tqdm
+import result_store
 
 client = OpenAI(
     base_url="",
@@ -12,6 +13,9 @@ OUTPUT_CSV = "outputs/clotho_evaluation_results.csv"
 
 MODEL_NAME = "Qwen/Qwen3-Next-80B-A3B-Instruct"
 
+# "csv" or "parquet"; parquet is converted from the CSV once evaluation finishes
+OUTPUT_FORMAT = "csv"
+
 
 FIELDNAMES = [
     "file_name",
@@ -23,6 +27,10 @@ FIELDNAMES = [
     "type_explanation",       
 ]
 
+# run_inference_NIC.py --sweep writes one row per (file_name, k); the k column is
+# carried into the evaluation so calculate.py can report HR by k
+SWEEP_COLUMN = "k"
+
 
 classification_prompt_template = """
 You are Qwen, an expert evaluator for hallucinations in audio-language models (ALMs).
@@ -139,8 +147,18 @@ Now perform the evaluation.
 
 
 
-with open(INPUT_CSV, "r", encoding="utf-8-sig") as f:
-    reader = list(csv.DictReader(f))
+# INPUT_CSV may also be a .parquet file written by the inference scripts;
+# rows are streamed so memory does not grow with the dataset
+reader = result_store.iter_rows(INPUT_CSV)
+
+sweep = SWEEP_COLUMN in result_store.read_fieldnames(INPUT_CSV)
+if sweep:
+    FIELDNAMES.insert(1, SWEEP_COLUMN)
+
+
+def row_key(row):
+    return (row["file_name"], str(row[SWEEP_COLUMN])) if sweep else row["file_name"]
+
 
 completed_ids = set()
 file_exists = os.path.exists(OUTPUT_CSV)
@@ -154,7 +172,7 @@ if file_exists:
         if set(existing_fields) == set(FIELDNAMES):
             schema_ok = True
             for r in out_reader:
-                completed_ids.add(r["file_name"])
+                completed_ids.add(row_key(r))
         else:
             print("⚠️ Detected schema mismatch in existing OUTPUT_CSV.")
             print("   Old file will be IGNORED to avoid column drift.")
@@ -162,11 +180,10 @@ if file_exists:
             completed_ids = set()
 
 print(f"{len(completed_ids)}")
-print(f"{len(reader)}")
 
 
 with open(OUTPUT_CSV, "a", newline="", encoding="utf-8-sig") as f_out:
-    writer = csv.DictWriter(f_out, fieldnames=FIELDNAMES)
+    writer = csv.DictWriter(f_out, fieldnames=FIELDNAMES, extrasaction="ignore")
     if not file_exists:
         writer.writeheader()
 
@@ -174,7 +191,7 @@ with open(OUTPUT_CSV, "a", newline="", encoding="utf-8-sig") as f_out:
         # print(item)
         audio_id = item["file_name"]
 
-        if audio_id in completed_ids:
+        if row_key(item) in completed_ids:
             continue
 
         final_caption = item["final_caption"]
@@ -235,6 +252,7 @@ with open(OUTPUT_CSV, "a", newline="", encoding="utf-8-sig") as f_out:
 
         row = {
             "file_name": audio_id,
+            SWEEP_COLUMN: item.get(SWEEP_COLUMN, ""),
             "final_caption": final_caption,
             "model_caption": model_caption,
             "hallucination_detected": hallucination_detected,
@@ -248,3 +266,6 @@ with open(OUTPUT_CSV, "a", newline="", encoding="utf-8-sig") as f_out:
         time.sleep(0.5)  
 
 print(f"Evaluation results saved to: {OUTPUT_CSV}")
+
+if OUTPUT_FORMAT == "parquet":
+    print(f"Parquet copy saved to: {result_store.csv_to_parquet(OUTPUT_CSV)}")
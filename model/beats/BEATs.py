@@ -122,10 +122,12 @@ class BEATs(nn.Module):
             fbank_std: float = 6.55582,
     ) -> torch.Tensor:
         fbanks = []
-        for waveform in source:
-            waveform = waveform.unsqueeze(0) * 2 ** 15
-            fbank = ta_kaldi.fbank(waveform, num_mel_bins=128, sample_frequency=16000, frame_length=25, frame_shift=10)
-            fbanks.append(fbank)
+        # log-mel features are always computed in fp32, also under autocast
+        with torch.autocast(device_type=source.device.type, enabled=False):
+            for waveform in source.float():
+                waveform = waveform.unsqueeze(0) * 2 ** 15
+                fbank = ta_kaldi.fbank(waveform, num_mel_bins=128, sample_frequency=16000, frame_length=25, frame_shift=10)
+                fbanks.append(fbank)
         fbank = torch.stack(fbanks, dim=0)
         fbank = (fbank - fbank_mean) / (2 * fbank_std)
         return fbank
@@ -136,7 +138,12 @@ class BEATs(nn.Module):
             padding_mask: Optional[torch.Tensor] = None,
             fbank_mean: float = 15.41663,
             fbank_std: float = 6.55582,
+            layer: Optional[int] = None,
     ):
+        """
+        layer: if set, stop after this transformer layer (0-based) and return its
+        output; later layers are not run.
+        """
         fbank = self.preprocess(source, fbank_mean=fbank_mean, fbank_std=fbank_std)
 
         if padding_mask is not None:
@@ -159,6 +166,7 @@ class BEATs(nn.Module):
         x, layer_results = self.encoder(
             x,
             padding_mask=padding_mask,
+            layer=layer,
         )
 
         return x, padding_mask
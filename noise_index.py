@@ -0,0 +1,227 @@
+import math
+import time
+import argparse
+import numpy as np
+import torch
+from typing import Optional, Tuple
+
+
+# =========================
+# Config
+# =========================
+# lists scanned per query. Single-core CPU, 100k x 768, nlist=316 (python noise_index.py):
+# nprobe=1 0.43 ms recall@4=0.64 / 2 0.47 ms 0.87 / 4 0.66 ms 0.98 / 8 1.26 ms 1.00.
+# 4 is the smallest setting that keeps recall@4 near 1 below 1 ms/query.
+NPROBE = 4
+KMEANS_ITERS = 20
+# k-means trains on at most this many points per list
+TRAIN_POINTS_PER_LIST = 256
+# rows scored per matmul during k-means assignment
+ASSIGN_CHUNK = 65536
+
+
+def l2_normalize(x: torch.Tensor) -> torch.Tensor:
+    """
+    x: (..., D); also used by noise_retrieval, which imports this module.
+    """
+    return x / x.norm(dim=-1, keepdim=True).clamp(min=1e-12)
+
+
+def exact_search(embeddings: torch.Tensor, queries: torch.Tensor, k: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Brute-force inner-product search.
+    embeddings: (N, D), queries: (B, D)
+    return: (sims, ids), each (B, k)
+    """
+    return torch.topk(queries @ embeddings.T, k=min(k, embeddings.shape[0]), dim=-1)
+
+
+def assign(x: torch.Tensor, centroids: torch.Tensor) -> torch.Tensor:
+    out = torch.empty(x.shape[0], dtype=torch.long)
+    for start in range(0, x.shape[0], ASSIGN_CHUNK):
+        out[start:start + ASSIGN_CHUNK] = (x[start:start + ASSIGN_CHUNK] @ centroids.T).argmax(dim=-1)
+    return out
+
+
+def spherical_kmeans(x: torch.Tensor, nlist: int, n_iter: int = KMEANS_ITERS, seed: int = 0) -> torch.Tensor:
+    """
+    x: (N, D) L2-normalized
+    return: (nlist, D) L2-normalized centroids
+    """
+    g = torch.Generator().manual_seed(seed)
+    centroids = x[torch.randperm(x.shape[0], generator=g)[:nlist]].clone()
+    for _ in range(n_iter):
+        labels = assign(x, centroids)
+        sums = torch.zeros_like(centroids).index_add_(0, labels, x)
+        counts = torch.bincount(labels, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # re-seed empty lists with random points
+            sums[empty] = x[torch.randint(0, x.shape[0], (int(empty.sum()),), generator=g)]
+        centroids = l2_normalize(sums)
+    return centroids
+
+
+# =========================
+# IVF index
+# =========================
+class IVFIndex:
+    """
+    Inverted-file index for cosine search over L2-normalized embeddings.
+
+    Vectors are clustered into `nlist` lists by spherical k-means and stored
+    contiguously list by list (CSR layout), so a query scores the `nprobe`
+    closest centroids and then only the vectors of those lists.
+    """
+
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = NPROBE, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+        self.centroids: Optional[torch.Tensor] = None  # (nlist, D)
+        self.offsets: Optional[torch.Tensor] = None    # (nlist + 1,)
+        self.ids: Optional[torch.Tensor] = None        # (N,) original row of each stored vector
+        self.vectors: Optional[torch.Tensor] = None    # (N, D) grouped by list
+
+    @property
+    def size(self) -> int:
+        return 0 if self.ids is None else self.ids.shape[0]
+
+    def build(self, embeddings: torch.Tensor) -> "IVFIndex":
+        """
+        embeddings: (N, D) L2-normalized
+        """
+        n = embeddings.shape[0]
+        if self.nlist is None:
+            self.nlist = max(1, int(round(math.sqrt(n))))
+        self.nlist = min(self.nlist, n)
+
+        g = torch.Generator().manual_seed(self.seed)
+        n_train = min(n, self.nlist * TRAIN_POINTS_PER_LIST)
+        train = embeddings[torch.randperm(n, generator=g)[:n_train]]
+        self.centroids = spherical_kmeans(train, self.nlist, seed=self.seed)
+
+        self._layout(assign(embeddings, self.centroids), embeddings)
+        return self
+
+    def _layout(self, labels: torch.Tensor, embeddings: torch.Tensor):
+        self.ids = torch.argsort(labels, stable=True)
+        counts = torch.bincount(labels, minlength=self.nlist)
+        self.offsets = torch.zeros(self.nlist + 1, dtype=torch.long)
+        self.offsets[1:] = torch.cumsum(counts, dim=0)
+        self.vectors = embeddings[self.ids].contiguous()
+
+    def search(self, queries: torch.Tensor, k: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        queries: (B, D) L2-normalized
+        return: (sims, ids), each (B, k); ids index the embeddings passed to build()
+        A query whose probed lists hold fewer than k vectors is answered by the
+        exact scan, so every row holds k real neighbours.
+        """
+        nprobe = min(self.nprobe, self.nlist)
+        probe = torch.topk(queries @ self.centroids.T, k=nprobe, dim=-1).indices  # (B, nprobe)
+        offsets = self.offsets.tolist()
+
+        k = min(k, self.size)
+        out_sims = torch.empty(queries.shape[0], k)
+        out_ids = torch.empty(queries.shape[0], k, dtype=torch.long)
+        for b, lists in enumerate(probe.tolist()):
+            # lists are contiguous slices, so score them in place without gathering rows
+            spans = [(offsets[l], offsets[l + 1]) for l in lists if offsets[l + 1] > offsets[l]]
+            if sum(e - s for s, e in spans) < k:
+                spans = [(0, self.size)]
+            sims = torch.cat([self.vectors[s:e] @ queries[b] for s, e in spans])
+            ids = torch.cat([self.ids[s:e] for s, e in spans])
+            top = torch.topk(sims, k=k)
+            out_sims[b] = top.values
+            out_ids[b] = ids[top.indices]
+        return out_sims, out_ids
+
+    def save(self, path: str):
+        """
+        Stores the quantizer and list layout; vectors are re-gathered from the
+        KB embeddings on load.
+        """
+        np.savez(
+            path,
+            centroids=self.centroids.numpy(),
+            offsets=self.offsets.numpy(),
+            ids=self.ids.numpy(),
+            nprobe=np.array(self.nprobe),
+            seed=np.array(self.seed),
+        )
+
+    @classmethod
+    def load(cls, path: str, embeddings: torch.Tensor) -> "IVFIndex":
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(nlist=int(data["centroids"].shape[0]), nprobe=int(data["nprobe"]), seed=int(data["seed"]))
+            index.centroids = torch.from_numpy(data["centroids"])
+            index.offsets = torch.from_numpy(data["offsets"])
+            index.ids = torch.from_numpy(data["ids"])
+        if index.size != embeddings.shape[0]:
+            raise ValueError(f"{path} indexes {index.size} vectors, the KB has {embeddings.shape[0]}")
+        index.vectors = embeddings[index.ids].contiguous()
+        return index
+
+
+# =========================
+# Benchmark
+# =========================
+def recall_at_k(index: IVFIndex, embeddings: torch.Tensor, queries: torch.Tensor, k: int) -> float:
+    """
+    Fraction of the exact top-k neighbours that the index also returns.
+    """
+    _, exact_ids = exact_search(embeddings, queries, k)
+    _, ann_ids = index.search(queries, k)
+    hits = sum(
+        len(set(e.tolist()) & set(a.tolist()))
+        for e, a in zip(exact_ids, ann_ids)
+    )
+    return hits / exact_ids.numel()
+
+
+def synthetic_embeddings(n: int, dim: int, n_clusters: int, seed: int = 0) -> torch.Tensor:
+    g = torch.Generator().manual_seed(seed)
+    centers = torch.randn(n_clusters, dim, generator=g)
+    labels = torch.randint(0, n_clusters, (n,), generator=g)
+    return l2_normalize(centers[labels] + 1.5 * torch.randn(n, dim, generator=g))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF vs exact retrieval benchmark.")
+    parser.add_argument("--embeddings", default="", help=".npy (N, D) matrix; synthetic data if empty")
+    parser.add_argument("--n", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.embeddings:
+        emb = l2_normalize(torch.from_numpy(np.load(args.embeddings)).float())
+    else:
+        emb = synthetic_embeddings(args.n, args.dim, n_clusters=max(1, args.n // 1000))
+    queries = l2_normalize(emb[torch.randperm(emb.shape[0])[: args.queries]] + 0.05 * torch.randn(args.queries, emb.shape[1]))
+
+    t = time.perf_counter()
+    index = IVFIndex(nlist=args.nlist).build(emb)
+    print(f"N={emb.shape[0]} D={emb.shape[1]} nlist={index.nlist} build={time.perf_counter() - t:.2f}s")
+
+    t = time.perf_counter()
+    for q in queries:
+        exact_search(emb, q[None], args.k)
+    print(f"exact           : {(time.perf_counter() - t) / len(queries) * 1000:.3f} ms/query")
+
+    for nprobe in args.nprobe:
+        index.nprobe = nprobe
+        t = time.perf_counter()
+        for q in queries:
+            index.search(q[None], args.k)
+        latency = (time.perf_counter() - t) / len(queries) * 1000
+        recall = recall_at_k(index, emb, queries, args.k)
+        print(f"ivf nprobe={nprobe:<4d}: {latency:.3f} ms/query  recall@{args.k}={recall:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 import os
+import json
+import hashlib
+import functools
 import torch
-import torchaudio
 import numpy as np
-from typing import List, Dict
-from dataclasses import dataclass
+from typing import Callable, List, Dict, Optional
+from dataclasses import asdict, dataclass
 from model.beats.BEATs import BEATs, BEATsConfig
+import audio_io
+from noise_index import IVFIndex, NPROBE, l2_normalize
+import spectral_prefilter
 
 
 # =========================
@@ -13,15 +18,61 @@ from model.beats.BEATs import BEATs, BEATsConfig
 SAMPLE_RATE = 16000
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
+# BEATs fbank framing (25 ms window, 10 ms shift at 16 kHz)
+FBANK_WIN = 400
+FBANK_HOP = 160
+# mel bins of the BEATs fbank; tokens are time patches x FBANK_BINS / patch frequency patches
+FBANK_BINS = 128
+# part of every encoder fingerprint; bump it when a fix changes the embeddings the
+# same checkpoint and options produce, so stores drop the stale ones
+ENCODING_REVISION = "r2"
+# clips per BEATs forward when encoding many clips
+ENCODE_BATCH_SIZE = 8
+# chunked encoding of long clips: window / hop length in seconds
+CHUNK_SECONDS = 10.0
+CHUNK_HOP_SECONDS = 5.0
+# encoder inference precision: "fp32", "bf16" (autocast) or "int8"
+# (dynamic quantization of the transformer Linear layers, CPU only)
+PRECISIONS = ("fp32", "bf16", "int8")
+# compiled encoder: clips are padded up to one of these lengths (seconds) and
+# batches up to one of COMPILE_BATCH_SIZES rows, so only these shapes are compiled
+LENGTH_BUCKETS = (2.0, 5.0, 10.0, 15.0, 20.0, 30.0)
+COMPILE_BATCH_SIZES = (1, ENCODE_BATCH_SIZE)
+# clips longer than the largest bucket are padded to a multiple of it; this many
+# such shapes are compiled on top of the bucket grid before dynamo gives up
+COMPILE_EXTRA_SHAPES = 8
+# the encoder loop graph-breaks at BEATs' layerdrop draw, so each layer's forward is
+# its own frame, compiled once for the first layer and once for the rest per shape
+COMPILES_PER_SHAPE = 2
+
 
 # =========================
 # Data structure
 # =========================
 @dataclass
-class NoiseItem:
+class NoiseMeta:
     audio_path: str
     caption: str
-    embedding: torch.Tensor  # (D,)
+
+
+@dataclass
+class QueryPolicy:
+    """
+    How query clips are embedded at retrieval time.
+    mode: "full" encodes the whole clip; "crops" encodes n_crops short crops
+    in one batch and averages them.
+    select: "energy" takes the loudest crops, "uniform" evenly spaced ones.
+    """
+    mode: str = "full"
+    n_crops: int = 3
+    crop_seconds: float = 2.0
+    select: str = "energy"
+
+    def identity(self) -> Dict:
+        """
+        The fields that decide the embeddings; crop settings are unused in "full" mode.
+        """
+        return {"mode": self.mode} if self.mode == "full" else asdict(self)
 
 
 # =========================
@@ -32,12 +83,131 @@ def load_audio(path: str, target_sr: int = 16000) -> torch.Tensor:
     Load audio and resample to target_sr.
     Return: Tensor [1, T]
     """
-    wav, sr = torchaudio.load(path)
-    if sr != target_sr:
-        wav = torchaudio.functional.resample(wav, sr, target_sr)
-    if wav.shape[0] > 1:
-        wav = wav.mean(dim=0, keepdim=True)
-    return wav
+    return audio_io.load_audio(path, target_sr)
+
+
+def file_sha1(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Content hash of a file.
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_checkpoint(path: str) -> dict:
+    """
+    torch.load with the weights memory-mapped instead of read up front.
+    Legacy (non-zip) checkpoints cannot be mapped and are read normally.
+    """
+    try:
+        return torch.load(path, map_location="cpu", mmap=True)
+    except RuntimeError:
+        return torch.load(path, map_location="cpu")
+
+
+def load_checkpoint_cfg(path: str) -> dict:
+    """
+    Only the BEATs cfg of a checkpoint: weights-only unpickling with the tensors
+    mapped (never read) when the checkpoint is a zip file.
+    """
+    try:
+        checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except RuntimeError:
+        checkpoint = torch.load(path, map_location="cpu", weights_only=True)
+    return checkpoint["cfg"]
+
+
+def checkpoint_fingerprint(path: str, probe_size: int = 1 << 20) -> str:
+    """
+    Cheap identity of a checkpoint: its size plus the first and last MiB.
+    """
+    size = os.path.getsize(path)
+    h = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        h.update(f.read(probe_size))
+        f.seek(max(size - probe_size, 0))
+        h.update(f.read(probe_size))
+    return h.hexdigest()
+
+
+def encoder_fingerprint(checkpoint_fp: str, layer: Optional[int] = None, precision: str = "fp32",
+                        chunk_seconds: Optional[float] = None, chunk_hop_seconds: float = CHUNK_HOP_SECONDS) -> str:
+    """
+    checkpoint_fp extended with the encoder options that change embeddings.
+    """
+    options = [ENCODING_REVISION]
+    if layer is not None:
+        options.append(f"layer{layer}")
+    if precision != "fp32":
+        options.append(precision)
+    if chunk_seconds is not None:
+        options.append(f"chunk{chunk_seconds:g}/{chunk_hop_seconds:g}")
+    return ":".join([checkpoint_fp] + options)
+
+
+def kb_version(encoder_fp: str, exemplars: List[Dict], query_policy: Optional[QueryPolicy] = None,
+               options: Optional[Dict] = None) -> str:
+    """
+    Identity of a KB's retrieval results: the encoder, the exemplars in KB
+    order (audio content and caption), the query policy and the settings of
+    any approximate tier in use (options). Results stored under one version
+    can be reused by any run that retrieves the same way.
+    exemplars: [{"audio_path", "caption"}, ...]
+    """
+    h = hashlib.sha1(encoder_fp.encode())
+    h.update(json.dumps([[file_sha1(item["audio_path"]), item["caption"]] for item in exemplars]).encode("utf-8"))
+    h.update(json.dumps(asdict(query_policy or QueryPolicy()), sort_keys=True).encode())
+    h.update(json.dumps(options or {}, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def extend_version(version: str, options: Optional[Dict] = None) -> str:
+    """
+    A KB version id refined by settings applied on top of that KB, such as
+    where query embeddings come from. No options leaves the version as is.
+    """
+    if not options:
+        return version
+    h = hashlib.sha1(version.encode())
+    h.update(json.dumps(options, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def select_crops(wav: torch.Tensor, n_crops: int, crop_len: int, select: str = "energy") -> List[torch.Tensor]:
+    """
+    Pick n_crops non-overlapping crops of crop_len samples, in time order.
+    Clips too short to hold them are returned whole.
+    wav: (1, T)
+    """
+    wav = wav.reshape(-1)
+    n_slots = wav.shape[0] // crop_len
+    if n_slots <= n_crops:
+        return [wav]
+
+    if select == "energy":
+        slots = wav[: n_slots * crop_len].reshape(n_slots, crop_len)
+        rms = slots.pow(2).mean(dim=-1)
+        picked = sorted(torch.topk(rms, k=n_crops).indices.tolist())
+    elif select == "uniform":
+        picked = torch.linspace(0, n_slots - 1, n_crops).round().long().tolist()
+    else:
+        raise ValueError(f"unknown crop selection: {select}")
+    return [wav[i * crop_len:(i + 1) * crop_len] for i in picked]
+
+
+def gate_exemplars(results: List[Dict], min_similarity: Optional[float] = None,
+                   max_k: Optional[int] = None) -> List[Dict]:
+    """
+    Adaptive top-k: keep the retrieved exemplars (best first) whose similarity
+    reaches min_similarity, at most max_k. None disables either bound.
+    The threshold is a BEATs cosine; spectral pre-filter results are kept as ranked.
+    """
+    if min_similarity is not None:
+        results = [r for r in results if r.get("tier", "beats") != "beats" or r["similarity"] >= min_similarity]
+    return results if max_k is None else results[:max_k]
 
 
 def mean_pooling(features: torch.Tensor, padding_mask: torch.Tensor):
@@ -50,61 +220,439 @@ def mean_pooling(features: torch.Tensor, padding_mask: torch.Tensor):
     return features.sum(dim=1) / mask.sum(dim=1).clamp(min=1)
 
 
-def cosine_similarity(a: torch.Tensor, b: torch.Tensor):
+# =========================
+# Embedding store
+# =========================
+class EmbeddingStore:
     """
-    a: (D,)
-    b: (N, D)
+    On-disk (.npz) cache of clip embeddings keyed by audio content hash.
+    Entries are only valid for the encoder they were computed with, so the
+    whole store is discarded when the encoder fingerprint changes.
     """
-    a = a / a.norm(dim=-1, keepdim=True)
-    b = b / b.norm(dim=-1, keepdim=True)
-    return torch.matmul(b, a)
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.embeddings: Dict[str, np.ndarray] = {}
+        self.dirty = False
+
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["fingerprint"]) == fingerprint:
+                    for key, emb in zip(data["keys"], data["embeddings"]):
+                        self.embeddings[str(key)] = emb
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.embeddings
+
+    def get(self, key: str) -> Optional[torch.Tensor]:
+        emb = self.embeddings.get(key)
+        return None if emb is None else torch.from_numpy(emb)
+
+    def put(self, key: str, emb: torch.Tensor):
+        self.embeddings[key] = emb.detach().cpu().numpy().astype(np.float32)
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        keys = sorted(self.embeddings)
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        tmp = self.path + ".tmp.npz"
+        np.savez(
+            tmp,
+            fingerprint=np.array(self.fingerprint),
+            keys=np.array(keys),
+            embeddings=np.stack([self.embeddings[k] for k in keys], axis=0),
+        )
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+class QueryEmbeddingStore:
+    """
+    Read-only view of precomputed query embeddings written by
+    precompute_query_embeddings.py: a memory-mapped (N, D) float32 .npy
+    matrix plus a JSON index mapping file_name -> row and recording the
+    encoder fingerprint and query policy the embeddings were made with.
+    """
+
+    def __init__(self, prefix: str, fingerprint: Optional[str] = None,
+                 query_policy: Optional[QueryPolicy] = None):
+        with open(prefix + ".json", "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if fingerprint is not None and index["fingerprint"] != fingerprint:
+            raise ValueError(
+                f"{prefix} was computed with a different BEATs encoder; rerun precompute_query_embeddings.py"
+            )
+        # indexes written before the policy was recorded hold full-clip embeddings
+        self.query_policy = index.get("query_policy", QueryPolicy().identity())
+        if query_policy is not None and self.query_policy != query_policy.identity():
+            raise ValueError(
+                f"{prefix} was computed with query policy {self.query_policy}, not {query_policy.identity()};"
+                " rerun precompute_query_embeddings.py"
+            )
+        self.prefix = prefix
+        self.fingerprint = index["fingerprint"]
+        self.rows = {name: i for i, name in enumerate(index["file_names"])}
+        self.matrix = np.load(prefix + ".npy", mmap_mode="r")
+
+    def __contains__(self, file_name: str) -> bool:
+        return file_name in self.rows
+
+    @property
+    def source(self) -> Dict:
+        """
+        Where retrieval query embeddings come from; part of the KB version id
+        of runs that use this store.
+        """
+        return {"prefix": self.prefix, "fingerprint": self.fingerprint, "query_policy": self.query_policy}
+
+    def get(self, file_name: str) -> Optional[torch.Tensor]:
+        row = self.rows.get(file_name)
+        if row is None:
+            return None
+        return torch.from_numpy(np.array(self.matrix[row]))
 
 
 # =========================
 # BEATs Encoder
 # =========================
 class BEATsEncoder:
-    def __init__(self, checkpoint_path: str):
-        checkpoint = torch.load(checkpoint_path, map_location="cpu")
+    def __init__(self, checkpoint_path: str, chunk_seconds: Optional[float] = None,
+                 chunk_hop_seconds: float = CHUNK_HOP_SECONDS, layer: Optional[int] = None,
+                 precision: str = "fp32", compiled: bool = False,
+                 length_buckets=LENGTH_BUCKETS):
+        """
+        chunk_seconds: if set, clips longer than this are encoded as overlapping
+        windows (see encode_chunked), so peak memory no longer grows with clip length.
+        layer: pool the output of this transformer layer (0-based) instead of the
+        last one; the layers after it are skipped.
+        precision: one of PRECISIONS.
+        compiled: run extract_features through torch.compile with static shapes;
+        inputs are padded to length_buckets (see warmup).
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {PRECISIONS}, got {precision!r}")
+        if precision == "int8" and DEVICE != "cpu":
+            raise ValueError("int8 dynamic quantization runs on CPU only")
+        self.layer = layer
+        self.precision = precision
+        self.chunk_seconds = chunk_seconds
+        self.chunk_hop_seconds = chunk_hop_seconds
+        checkpoint = load_checkpoint(checkpoint_path)
         cfg = BEATsConfig(checkpoint["cfg"])
         self.model = BEATs(cfg)
         self.model.load_state_dict(checkpoint["model"])
         self.model.eval()
         self.model.to(DEVICE)
+        if precision == "int8":
+            # the Linear layers of TransformerSentenceEncoderLayer / MultiheadAttention;
+            # patch embedding, conv positional embedding and norms stay fp32
+            torch.ao.quantization.quantize_dynamic(
+                self.model.encoder.layers, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
+        self.checkpoint_fingerprint = checkpoint_fingerprint(checkpoint_path)
+
+        self.compiled = compiled
+        self.length_buckets = sorted(int(s * SAMPLE_RATE) for s in length_buckets) if compiled else []
+        self.batch_buckets = sorted(COMPILE_BATCH_SIZES) if compiled else []
+        if compiled:
+            # every static shape is a recompile of the same frames; dynamo's default
+            # limit (8) is below the bucket grid and would silently run the rest eagerly
+            n_shapes = len(self.length_buckets) * len(self.batch_buckets) + COMPILE_EXTRA_SHAPES
+            dynamo_config = torch._dynamo.config
+            limit = "recompile_limit" if hasattr(dynamo_config, "recompile_limit") else "cache_size_limit"
+            setattr(dynamo_config, limit, max(getattr(dynamo_config, limit), n_shapes * COMPILES_PER_SHAPE))
+        self._extract_features = (
+            torch.compile(self.model.extract_features, dynamic=False) if compiled
+            else self.model.extract_features
+        )
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identity of the embeddings this encoder produces: the checkpoint plus
+        any option that changes them.
+        """
+        return encoder_fingerprint(
+            self.checkpoint_fingerprint, self.layer, self.precision, self.chunk_seconds, self.chunk_hop_seconds
+        )
+
+    @property
+    def min_samples(self) -> int:
+        """
+        Samples in the shortest clip that fills one time patch of fbank frames.
+        """
+        return FBANK_WIN + (self.model.input_patch_size - 1) * FBANK_HOP
+
+    def padding_mask_for(self, lengths: List[int], padded_len: int) -> torch.Tensor:
+        """
+        Sample-level padding mask for clips right-padded to padded_len.
+
+        BEATs reduces the mask to fbank frames and then to tokens by splitting
+        it into equal consecutive spans and marking a frame / token as padding
+        only if *all* of its span is padding. Its tokens are time-major (time
+        patch x frequency patch), so the span of token j is not the frames of
+        that token. The mask is therefore built in token space: a clip keeps
+        the tokens of its whole time patches, and every sample from the span
+        of its first dropped token onward is marked. BEATs' reduction then
+        keeps exactly the tokens the clip produces on its own, so batched and
+        single-clip embeddings match.
+        """
+        n_frames = 1 + (padded_len - FBANK_WIN) // FBANK_HOP
+        samples_per_frame = padded_len // n_frames
+        patch = self.model.input_patch_size
+        freq_patches = FBANK_BINS // patch
+        n_tokens = (n_frames // patch) * freq_patches
+        frames_per_token = n_frames // n_tokens
+
+        mask = torch.zeros(len(lengths), padded_len, dtype=torch.bool)
+        for i, length in enumerate(lengths):
+            clip_frames = max(0, 1 + (length - FBANK_WIN) // FBANK_HOP)
+            valid_tokens = (clip_frames // patch) * freq_patches
+            mask[i, valid_tokens * frames_per_token * samples_per_frame:] = True
+        return mask
+
+    @staticmethod
+    def bucket(size: int, buckets: List[int]) -> int:
+        """
+        Smallest bucket >= size; sizes beyond the largest bucket are rounded up
+        to a multiple of it, so long clips also reuse a few compiled shapes.
+        """
+        for b in buckets:
+            if size <= b:
+                return b
+        if not buckets:
+            return size
+        return -(-size // buckets[-1]) * buckets[-1]
 
     @torch.no_grad()
+    def forward_batch(self, wavs: List[torch.Tensor]):
+        """
+        wavs: list of (1, T_i) or (T_i,) waveforms
+        return: token features (B, P, D) and token padding mask (B, P)
+        """
+        # clips shorter than one time patch would produce no token at all; pad
+        # them with silence up to one patch, alone or in a batch
+        min_len = self.min_samples
+        wavs = [w.reshape(-1) for w in wavs]
+        wavs = [torch.cat([w, w.new_zeros(min_len - w.shape[0])]) if w.shape[0] < min_len else w for w in wavs]
+        n = len(wavs)
+        if self.compiled:
+            # fill the batch up to its bucket with copies of the first clip
+            wavs = wavs + [wavs[0]] * (self.bucket(n, self.batch_buckets) - n)
+        lengths = [w.shape[0] for w in wavs]
+        # extra padding is exact: padding_mask_for hides it from every token
+        padded_len = self.bucket(max(lengths), self.length_buckets)
+
+        batch = torch.zeros(len(wavs), padded_len)
+        for i, w in enumerate(wavs):
+            batch[i, : lengths[i]] = w
+        padding_mask = self.padding_mask_for(lengths, padded_len)
+
+        with torch.autocast(device_type=DEVICE, dtype=torch.bfloat16, enabled=self.precision == "bf16"):
+            feats, feat_padding_mask = self._extract_features(
+                batch.to(DEVICE), padding_mask=padding_mask.to(DEVICE), layer=self.layer
+            )
+        return feats[:n].float(), feat_padding_mask[:n]
+
+    def warmup(self):
+        """
+        Compile every (batch bucket, length bucket) shape up front, so the first
+        real request does not pay for compilation. No-op for eager encoders.
+        """
+        for length in self.length_buckets:
+            for rows in self.batch_buckets:
+                self.forward_batch([torch.zeros(length)] * rows)
+
+    def encode_batch(self, wavs: List[torch.Tensor]) -> torch.Tensor:
+        """
+        wavs: list of (1, T_i) or (T_i,) waveforms
+        return: (B, D)
+        """
+        feats, feat_padding_mask = self.forward_batch(wavs)
+        return mean_pooling(feats, feat_padding_mask).cpu()
+
+    def encode_chunked(self, wav: torch.Tensor, chunk_seconds: float = CHUNK_SECONDS,
+                       hop_seconds: float = CHUNK_HOP_SECONDS,
+                       batch_size: int = ENCODE_BATCH_SIZE) -> torch.Tensor:
+        """
+        Encode a long clip as overlapping fixed-length windows, `batch_size`
+        windows per forward, and mean-pool all window tokens into one embedding.
+        Tokens are weighted by 1 / (number of windows covering them), so
+        overlapping regions count once, as in full-clip pooling.
+        Peak memory depends on chunk_seconds and batch_size, not clip length.
+        wav: (1, T)
+        return: (D,)
+        """
+        wav = wav.reshape(-1)
+        win = int(chunk_seconds * SAMPLE_RATE)
+        hop = int(hop_seconds * SAMPLE_RATE)
+        if wav.shape[0] <= win:
+            return self.encode(wav)
+
+        starts = list(range(0, wav.shape[0] - win + 1, hop))
+        if starts[-1] + win < wav.shape[0]:
+            starts.append(wav.shape[0] - win)
+        starts_t = torch.tensor(starts)
+
+        patch = self.model.input_patch_size
+        win_patches = (1 + (win - FBANK_WIN) // FBANK_HOP) // patch
+        total, weight = None, 0.0
+        for i in range(0, len(starts), batch_size):
+            chunk_starts = starts[i:i + batch_size]
+            feats, mask = self.forward_batch([wav[s:s + win] for s in chunk_starts])
+            feats, mask = feats.cpu(), mask.cpu()
+
+            # sample position of each token's time patch centre
+            n_tokens = feats.shape[1]
+            n_freq = n_tokens // win_patches  # tokens are time-major, n_freq per time patch
+            token_time = (torch.arange(n_tokens) // n_freq * patch + patch // 2) * FBANK_HOP
+            centres = torch.tensor(chunk_starts)[:, None] + token_time[None, :]  # (b, P)
+            coverage = (
+                (starts_t[None, None, :] <= centres[..., None])
+                & (centres[..., None] < starts_t[None, None, :] + win)
+            ).sum(-1).clamp(min=1)
+
+            w = (~mask).float() / coverage
+            part = (feats * w.unsqueeze(-1)).sum(dim=(0, 1))
+            total = part if total is None else total + part
+            weight += w.sum().item()
+        return total / max(weight, 1e-12)
+
+    def encode_many(self, wavs: List[torch.Tensor], batch_size: int = ENCODE_BATCH_SIZE) -> torch.Tensor:
+        """
+        Encode any number of clips, batching clips of similar length together.
+        With chunking enabled, clips longer than the window are encoded chunked.
+        return: (N, D) in input order
+        """
+        out = [None] * len(wavs)
+        order = sorted(range(len(wavs)), key=lambda i: wavs[i].shape[-1])
+        if self.chunk_seconds is not None:
+            win = int(self.chunk_seconds * SAMPLE_RATE)
+            for i in [i for i in order if wavs[i].shape[-1] > win]:
+                out[i] = self.encode_chunked(wavs[i], self.chunk_seconds, self.chunk_hop_seconds, batch_size)
+            order = [i for i in order if out[i] is None]
+
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            embs = self.encode_batch([wavs[i] for i in idx])
+            for i, emb in zip(idx, embs):
+                out[i] = emb
+        return torch.stack(out, dim=0)
+
     def encode(self, wav: torch.Tensor) -> torch.Tensor:
         """
         wav: (1, T)
         return: (D,)
         """
-        wav = wav.to(DEVICE)
-        padding_mask = torch.zeros_like(wav).bool()
-        feats = self.model.extract_features(
-            wav, padding_mask=padding_mask
-        )[0]  # (B, T, D)
-        pooled = mean_pooling(feats, padding_mask)
-        return pooled.squeeze(0).cpu()
+        if self.chunk_seconds is not None and wav.shape[-1] > self.chunk_seconds * SAMPLE_RATE:
+            return self.encode_chunked(wav, self.chunk_seconds, self.chunk_hop_seconds)
+        return self.encode_batch([wav])[0]
 
 
 # =========================
 # Noise Knowledge Base
 # =========================
 class NoiseKnowledgeBase:
-    def __init__(self, beats_ckpt: str):
-        self.encoder = BEATsEncoder(beats_ckpt)
-        self.noise_items: List[NoiseItem] = []
+    """
+    Exemplar embeddings live in one contiguous, L2-normalized (N, D) matrix
+    with a parallel metadata list, so a query is a single matmul + topk.
+    """
 
-    def add_noise(self, audio_path: str, caption: str):
-        wav = load_audio(audio_path)
-        emb = self.encoder.encode(wav)
-        self.noise_items.append(
-            NoiseItem(
-                audio_path=audio_path,
-                caption=caption,
-                embedding=emb,
-            )
+    def __init__(self, beats_ckpt: str, store_path: Optional[str] = None,
+                 query_policy: Optional[QueryPolicy] = None, layer: Optional[int] = None,
+                 precision: str = "fp32", compiled: bool = False, chunk_seconds: Optional[float] = None,
+                 chunk_hop_seconds: float = CHUNK_HOP_SECONDS):
+        """
+        store_path: optional .npz embedding store; exemplars whose audio content
+        and encoder are unchanged are read from it instead of re-encoded.
+        query_policy: how query clips are embedded (full clip by default).
+        layer: BEATs layer to pool (see BEATsEncoder); None uses the last one.
+        precision: encoder inference precision, one of PRECISIONS.
+        compiled: use a torch.compile'd encoder (call encoder.warmup() before serving).
+        chunk_seconds / chunk_hop_seconds: encode clips longer than chunk_seconds as
+        overlapping windows (see BEATsEncoder); None encodes every clip whole.
+        """
+        self.encoder = BEATsEncoder(
+            beats_ckpt, chunk_seconds=chunk_seconds, chunk_hop_seconds=chunk_hop_seconds,
+            layer=layer, precision=precision, compiled=compiled,
         )
+        self.query_policy = query_policy or QueryPolicy()
+        self.metadata: List[NoiseMeta] = []
+        self._matrix: Optional[torch.Tensor] = None  # (capacity, D), rows [0, len) in use
+        self.store = EmbeddingStore(store_path, self.encoder.fingerprint) if store_path else None
+        # optional approximate index; ignored while it does not cover every exemplar
+        self.index: Optional[IVFIndex] = None
+        # optional cheap DSP tier in front of BEATs; ignored while it does not cover every exemplar
+        self.prefilter: Optional[spectral_prefilter.SpectralPrefilter] = None
+
+    def __len__(self) -> int:
+        return len(self.metadata)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Fingerprint of the encoder query embeddings must come from.
+        """
+        return self.encoder.fingerprint
+
+    @property
+    def version(self) -> str:
+        """
+        KB version id (see kb_version) that stored retrieval results are keyed by.
+        """
+        options = {}
+        if self.index is not None and self.index.size == len(self):
+            options["ivf"] = {"nlist": self.index.nlist, "nprobe": self.index.nprobe}
+        if self.prefilter is not None and self.prefilter.size == len(self):
+            options["prefilter"] = self.prefilter.params
+        return kb_version(self.fingerprint, [asdict(m) for m in self.metadata], self.query_policy, options)
+
+    @property
+    def embeddings(self) -> torch.Tensor:
+        """
+        (N, D) normalized exemplar embeddings.
+        """
+        if self._matrix is None:
+            return torch.empty(0, 0)
+        return self._matrix[: len(self)]
+
+    def embed_files(self, audio_paths: List[str]) -> List[torch.Tensor]:
+        """
+        Embeddings for audio files, reading the store first and batch-encoding the rest.
+        """
+        keys = [file_sha1(p) if self.store is not None else None for p in audio_paths]
+        embs = [self.store.get(k) if k is not None and k in self.store else None for k in keys]
+
+        missing = [i for i, e in enumerate(embs) if e is None]
+        if missing:
+            encoded = self.encoder.encode_many(audio_io.load_many([audio_paths[i] for i in missing]))
+            for i, emb in zip(missing, encoded):
+                embs[i] = emb
+                if keys[i] is not None:
+                    self.store.put(keys[i], emb)
+        return embs
+
+    def add_embedding(self, emb: torch.Tensor, audio_path: str, caption: str):
+        """
+        Append one exemplar; the matrix grows geometrically so appends are amortized O(D).
+        """
+        n = len(self)
+        if self._matrix is None:
+            self._matrix = torch.empty(16, emb.shape[-1], dtype=torch.float32)
+        elif n == self._matrix.shape[0]:
+            grown = torch.empty(2 * n, self._matrix.shape[1], dtype=torch.float32)
+            grown[:n] = self._matrix[:n]
+            self._matrix = grown
+        self._matrix[n] = l2_normalize(emb.float())
+        self.metadata.append(NoiseMeta(audio_path=audio_path, caption=caption))
+
+    def add_noise(self, audio_path: str, caption: str):
+        self.add_embedding(self.embed_files([audio_path])[0], audio_path, caption)
 
     def build_from_list(self, noise_list: List[Dict]):
         """
@@ -117,29 +665,156 @@ class NoiseKnowledgeBase:
             ...
         ]
         """
-        for item in noise_list:
-            self.add_noise(item["audio_path"], item["caption"])
+        embs = self.embed_files([item["audio_path"] for item in noise_list])
+        for item, emb in zip(noise_list, embs):
+            self.add_embedding(emb, item["audio_path"], item["caption"])
+        if self.store is not None:
+            self.store.save()
+
+    def build_index(self, nlist: Optional[int] = None, nprobe: int = NPROBE):
+        """
+        Build an IVF index over the current exemplars (worth it for large KBs).
+        Exemplars added afterwards are only searchable once the index is rebuilt;
+        until then retrieval falls back to the exact scan.
+        """
+        self.index = IVFIndex(nlist=nlist, nprobe=nprobe).build(self.embeddings)
 
-    def retrieve(self, query_audio_path: str, topk: int = 3):
-        wav = load_audio(query_audio_path)
-        query_emb = self.encoder.encode(wav)
+    def save_index(self, path: str):
+        self.index.save(path)
 
-        embeddings = torch.stack(
-            [n.embedding for n in self.noise_items], dim=0
-        )  # (N, D)
+    def load_index(self, path: str):
+        self.index = IVFIndex.load(path, self.embeddings)
 
-        sims = cosine_similarity(query_emb, embeddings)
-        topk_idx = torch.topk(sims, k=topk).indices.tolist()
+    def enable_prefilter(self, prefilter: Optional[spectral_prefilter.SpectralPrefilter] = None):
+        """
+        Fit a spectral pre-filter on the current exemplars. retrieve_batch then
+        runs BEATs only for queries the cheap tier finds ambiguous.
+        """
+        prefilter = prefilter or spectral_prefilter.SpectralPrefilter()
+        self.prefilter = prefilter.fit(audio_io.load_many([m.audio_path for m in self.metadata]))
+
+    def search(self, query_emb: torch.Tensor, topk: int = 3):
+        """
+        query_emb: (D,) or (B, D) unnormalized query embeddings
+        return: (similarities, indices), each (k,) or (B, k)
+        """
+        query = l2_normalize(query_emb.float())
+        if self.index is not None and self.index.size == len(self):
+            sims, idxs = self.index.search(query.reshape(-1, query.shape[-1]), topk)
+            if query.dim() == 1:
+                return sims[0], idxs[0]
+            return sims, idxs
+        sims = query @ self.embeddings.T
+        return torch.topk(sims, k=min(topk, len(self)), dim=-1)
 
+    def format_results(self, sims, idxs, tier: str = "beats") -> List[Dict]:
+        """
+        tier: which retrieval stage scored the results ("beats" cosine or
+        "spectral" pre-filter score); the scales are not comparable.
+        """
+        sims = sims.tolist() if torch.is_tensor(sims) else list(sims)
+        idxs = idxs.tolist() if torch.is_tensor(idxs) else list(idxs)
         results = []
-        for idx in topk_idx:
-            item = self.noise_items[idx]
+        for sim, idx in zip(sims, idxs):
+            if idx < 0:  # padding from an index that found fewer than k neighbours
+                continue
+            meta = self.metadata[idx]
             results.append(
                 {
-                    "audio_path": item.audio_path,
-                    "caption": item.caption,
-                    "similarity": sims[idx].item(),
+                    "index": int(idx),
+                    "audio_path": meta.audio_path,
+                    "caption": meta.caption,
+                    "similarity": sim,
+                    "tier": tier,
                 }
             )
         return results
 
+    def encode_queries(self, wavs: List[torch.Tensor], batch_size: int = ENCODE_BATCH_SIZE) -> torch.Tensor:
+        """
+        Embed query clips according to self.query_policy.
+        return: (B, D)
+        """
+        policy = self.query_policy
+        if policy.mode == "full":
+            return self.encoder.encode_many(wavs, batch_size=batch_size)
+        if policy.mode != "crops":
+            raise ValueError(f"unknown query policy mode: {policy.mode}")
+
+        crop_len = int(policy.crop_seconds * SAMPLE_RATE)
+        crops, owner = [], []
+        for i, wav in enumerate(wavs):
+            for crop in select_crops(wav, policy.n_crops, crop_len, policy.select):
+                crops.append(crop)
+                owner.append(i)
+
+        # equal-length crops from all queries share batches
+        crop_embs = self.encoder.encode_many(crops, batch_size=max(batch_size, policy.n_crops))
+        owner = torch.tensor(owner)
+        sums = torch.zeros(len(wavs), crop_embs.shape[1]).index_add_(0, owner, crop_embs)
+        counts = torch.bincount(owner, minlength=len(wavs)).clamp(min=1)
+        return sums / counts[:, None]
+
+    def retrieve(self, query_audio_path: Optional[str] = None, topk: int = 3,
+                 query_embedding: Optional[torch.Tensor] = None):
+        """
+        query_embedding: precomputed (D,) query embedding; skips loading and encoding the audio.
+        """
+        if query_embedding is not None:
+            sims, idxs = self.search(query_embedding, topk)
+            return self.format_results(sims, idxs)
+        return self.retrieve_batch([query_audio_path], topk=topk)[0]
+
+    def retrieve_batch(self, query_audio_paths: List[str], topk: int = 3,
+                       batch_size: int = ENCODE_BATCH_SIZE) -> List[List[Dict]]:
+        """
+        Retrieve for many query clips; queries are encoded in padded batches.
+        """
+        return self.retrieve_wavs(audio_io.load_many(query_audio_paths), topk=topk, batch_size=batch_size)
+
+    def retrieve_wavs(self, wavs: List[torch.Tensor], topk: int = 3, batch_size: int = ENCODE_BATCH_SIZE,
+                      encode: Optional[Callable[[List[torch.Tensor]], torch.Tensor]] = None) -> List[List[Dict]]:
+        """
+        retrieve_batch for loaded query waveforms.
+        encode: runs the BEATs forward for a list of queries in place of
+        encode_queries (e.g. embedding_service's micro-batcher).
+        """
+        if encode is None:
+            encode = functools.partial(self.encode_queries, batch_size=batch_size)
+        if self.prefilter is not None and self.prefilter.size == len(self):
+            return self._retrieve_tiered(wavs, topk, encode)
+
+        sims, idxs = self.search(encode(wavs), topk)
+        return [self.format_results(s, i) for s, i in zip(sims, idxs)]
+
+    def _retrieve_tiered(self, wavs: List[torch.Tensor], topk: int,
+                         encode: Callable[[List[torch.Tensor]], torch.Tensor]) -> List[List[Dict]]:
+        """
+        Spectral pre-filter first: confident queries get the cheap ranking and
+        ambiguous ones a BEATs forward re-ranking their shortlist. Skipped
+        queries are ranked by BEATs over every exemplar, so the similarity gate
+        decides as without the pre-filter (zero exemplars with skip_empty).
+        """
+        out = [None] * len(wavs)
+        beats, shortlists = [], []
+        for i, wav in enumerate(wavs):
+            decision, order, dists = self.prefilter.classify(wav)
+            if decision == spectral_prefilter.SKIP and self.prefilter.skip_empty:
+                out[i] = []
+            elif decision == spectral_prefilter.CONFIDENT:
+                top = order[:topk]
+                out[i] = self.format_results([spectral_prefilter.score(dists[j]) for j in top], top, tier="spectral")
+            else:
+                beats.append(i)
+                shortlists.append(None if decision == spectral_prefilter.SKIP else torch.from_numpy(order.copy()))
+
+        if beats:
+            query = l2_normalize(encode([wavs[i] for i in beats]))
+            for q, i, cand in zip(query, beats, shortlists):
+                if cand is None:
+                    out[i] = self.format_results(*self.search(q, topk))
+                    continue
+                sims = self.embeddings[cand] @ q
+                top = torch.topk(sims, k=min(topk, cand.numel()))
+                out[i] = self.format_results(top.values, cand[top.indices])
+        return out
@@ -0,0 +1,82 @@
+import os
+import csv
+import json
+import numpy as np
+from tqdm import tqdm
+import audio_io
+import noise_retrieval as noise_retrieval
+
+META_CSV = "data/data.csv"
+
+AUDIO_ROOT = "data/clotho"
+
+BEATS_CKPT = "checkpoints/BEATs_iter3_plus_AS2M_finetuned_on_AS2M_cpt2.pt"
+
+# must match BEATS_LAYER / BEATS_PRECISION / BEATS_CHUNK_* / QUERY_POLICY in
+# run_inference_NIC.py; the NIC script refuses embeddings made with another encoder
+# or query policy
+BEATS_LAYER = None
+BEATS_PRECISION = "fp32"
+BEATS_CHUNK_SECONDS = None
+BEATS_CHUNK_HOP_SECONDS = 5.0
+QUERY_POLICY = dict(mode="full", n_crops=3, crop_seconds=2.0)
+
+# writes <prefix>.npy (N, D) float32 and <prefix>.json (file_name index, encoder
+# fingerprint and query policy)
+OUTPUT_PREFIX = "checkpoints/clotho_query_embeddings"
+
+# clips loaded and encoded per step; bounds memory
+CHUNK_SIZE = 64
+
+# prefix written by build_audio_shard.py; "" decodes every clip from its WAV file
+AUDIO_SHARD_PREFIX = ""
+
+
+def main():
+    with open(META_CSV, "r", encoding="utf-8") as f:
+        names = list(dict.fromkeys(row["file_name"] for row in csv.DictReader(f)))
+
+    present = []
+    for name in names:
+        if os.path.exists(os.path.join(AUDIO_ROOT, name)):
+            present.append(name)
+        else:
+            print(os.path.join(AUDIO_ROOT, name))
+
+    print(f"{len(present)} / {len(names)} clips found")
+    if not present:
+        return
+
+    if AUDIO_SHARD_PREFIX:
+        audio_io.open_shard(AUDIO_SHARD_PREFIX)
+    # an empty KB: only its query encoding (encode_queries) is used
+    policy = noise_retrieval.QueryPolicy(**QUERY_POLICY)
+    kb = noise_retrieval.NoiseKnowledgeBase(
+        BEATS_CKPT, query_policy=policy, layer=BEATS_LAYER, precision=BEATS_PRECISION,
+        chunk_seconds=BEATS_CHUNK_SECONDS, chunk_hop_seconds=BEATS_CHUNK_HOP_SECONDS,
+    )
+    os.makedirs(os.path.dirname(OUTPUT_PREFIX) or ".", exist_ok=True)
+
+    matrix = None
+    for start in tqdm(range(0, len(present), CHUNK_SIZE), desc="Encoding queries"):
+        chunk = present[start:start + CHUNK_SIZE]
+        wavs = audio_io.load_many([os.path.join(AUDIO_ROOT, n) for n in chunk])
+        embs = kb.encode_queries(wavs).numpy().astype(np.float32)
+        if matrix is None:
+            matrix = np.lib.format.open_memmap(
+                OUTPUT_PREFIX + ".npy", mode="w+", dtype=np.float32, shape=(len(present), embs.shape[1])
+            )
+        matrix[start:start + len(chunk)] = embs
+
+    matrix.flush()
+    with open(OUTPUT_PREFIX + ".json", "w", encoding="utf-8") as f:
+        json.dump(
+            {"fingerprint": kb.fingerprint, "query_policy": policy.identity(), "file_names": present},
+            f, ensure_ascii=False,
+        )
+
+    print(f"{OUTPUT_PREFIX}.npy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import io
+import os
+import csv
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # parquet output is optional
+    pa = None
+    pq = None
+
+
+# =========================
+# Schema
+# =========================
+BOOL_COLUMNS = {"hallucination_detected"}
+LIST_COLUMNS = {"hallucination_types", "new_objects_or_events"}
+# low-cardinality strings stored dictionary-encoded
+CATEGORY_COLUMNS = {"model_name"}
+
+PARQUET_BATCH_ROWS = 8192
+
+
+def is_parquet(path: str) -> bool:
+    return path.endswith(".parquet")
+
+
+def output_fieldnames(fieldnames: Iterable[str]) -> List[str]:
+    """
+    Input columns worth copying into an output file.
+    Drops the empty pandas index columns ("Unnamed: 7" ...) of data/data.csv.
+    """
+    return [name for name in fieldnames if name and not name.startswith("Unnamed:")]
+
+
+def to_bool(value) -> Optional[bool]:
+    if value is None or isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in ["true", "1", "yes"]:
+        return True
+    if value in ["false", "0", "no"]:
+        return False
+    return None
+
+
+def to_list(value) -> List[str]:
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    value = (value or "").strip()
+    if not value:
+        return []
+    try:
+        value = json.loads(value)
+    except Exception:
+        return [value]
+    if not isinstance(value, list):
+        value = [value]
+    return [str(v) for v in value]
+
+
+def arrow_schema(fieldnames: List[str]):
+    fields = []
+    for name in fieldnames:
+        if name in BOOL_COLUMNS:
+            fields.append(pa.field(name, pa.bool_()))
+        elif name in LIST_COLUMNS:
+            fields.append(pa.field(name, pa.list_(pa.string())))
+        elif name in CATEGORY_COLUMNS:
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def typed_row(row: Dict, fieldnames: List[str]) -> Dict:
+    out = {}
+    for name in fieldnames:
+        value = row.get(name)
+        if name in BOOL_COLUMNS:
+            out[name] = to_bool(value)
+        elif name in LIST_COLUMNS:
+            out[name] = to_list(value)
+        else:
+            out[name] = None if value is None else str(value)
+    return out
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("Parquet results need pyarrow: pip install pyarrow")
+
+
+# =========================
+# Read / write
+# =========================
+def iter_rows(path: str, columns: Optional[List[str]] = None) -> Iterator[Dict]:
+    """
+    Stream result rows as dicts from a CSV or Parquet file.
+    columns: only these columns are read (Parquet) or kept (CSV); missing ones are skipped.
+    Parquet rows carry typed values (bool, list); CSV rows carry strings.
+    """
+    if is_parquet(path):
+        yield from iter_parquet_rows(path, columns=columns)
+        return
+
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        if columns is None:
+            yield from reader
+            return
+        keep = [c for c in columns if c in (reader.fieldnames or [])]
+        for row in reader:
+            yield {c: row[c] for c in keep}
+
+
+def iter_parquet_rows(path: str, start: int = 0, columns: Optional[List[str]] = None) -> Iterator[Dict]:
+    """
+    Stream Parquet rows from row `start` on; row groups entirely before it are not read.
+    """
+    require_pyarrow()
+    pf = pq.ParquetFile(path)
+    if columns is not None:
+        columns = [c for c in columns if c in pf.schema_arrow.names]
+    groups, skip, end = [], start, 0
+    for i in range(pf.metadata.num_row_groups):
+        end += pf.metadata.row_group(i).num_rows
+        if end > start:
+            groups.append(i)
+        else:
+            skip = start - end
+    if not groups:
+        return
+    for batch in pf.iter_batches(batch_size=PARQUET_BATCH_ROWS, row_groups=groups, columns=columns):
+        if skip >= batch.num_rows:
+            skip -= batch.num_rows
+            continue
+        yield from batch.slice(skip).to_pylist()
+        skip = 0
+
+
+def iter_csv_records(path: str, offset: int = 0, columns: Optional[List[str]] = None) -> Iterator[Tuple[Dict, int]]:
+    """
+    Stream (row, end_offset) pairs from a CSV starting at byte `offset`
+    (0 = first data row). end_offset is the byte position just after the row,
+    so a consumer can later resume an appended file from there.
+    A final record without a line break is returned once its quotes are
+    balanced; a trailing record with an open quote is partially written and
+    is not returned.
+    """
+    with open(path, "rb") as f:
+        header_line = f.readline()
+        fieldnames = next(csv.reader([header_line.decode("utf-8-sig")]), [])
+        keep = fieldnames if columns is None else [c for c in columns if c in fieldnames]
+        if offset:
+            f.seek(offset)
+
+        record = b""
+        while True:
+            line = f.readline()
+            # readline only returns an unterminated line (or b"") at the end of the file
+            at_eof = not line.endswith(b"\n")
+            record += line
+            # a record is complete once its quotes are balanced and it ends a line or the file
+            if record and not record.count(b'"') % 2 and (record.endswith(b"\n") or at_eof):
+                values = next(csv.reader(io.StringIO(record.decode("utf-8"), newline="")), [])
+                record = b""
+                if values:
+                    row = dict(zip(fieldnames, values))
+                    yield {c: row.get(c, "") for c in keep}, f.tell()
+            if at_eof:
+                break
+
+
+def read_fieldnames(path: str) -> List[str]:
+    if is_parquet(path):
+        require_pyarrow()
+        return list(pq.ParquetFile(path).schema_arrow.names)
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def write_parquet(rows: Iterable[Dict], path: str, fieldnames: List[str]):
+    """
+    Write rows (CSV strings or typed values) to Parquet with the typed schema.
+    """
+    require_pyarrow()
+    schema = arrow_schema(fieldnames)
+    writer = pq.ParquetWriter(path, schema, compression="zstd")
+    try:
+        batch = []
+        for row in rows:
+            batch.append(typed_row(row, fieldnames))
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    finally:
+        writer.close()
+
+
+def csv_to_parquet(csv_path: str, parquet_path: Optional[str] = None) -> str:
+    """
+    Convert a results CSV to Parquet next to it (same name, .parquet suffix).
+    """
+    if parquet_path is None:
+        parquet_path = os.path.splitext(csv_path)[0] + ".parquet"
+    fieldnames = output_fieldnames(read_fieldnames(csv_path))
+    write_parquet(iter_rows(csv_path), parquet_path, fieldnames)
+    return parquet_path
+
+
+if __name__ == "__main__":
+    import sys
+
+    for path in sys.argv[1:]:
+        print(csv_to_parquet(path))
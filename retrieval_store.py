@@ -0,0 +1,174 @@
+import os
+import json
+import sqlite3
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# =========================
+# Config
+# =========================
+# written by run_inference_NIC.py; shared by every ALM / prompt run on the same KB
+STORE_PATH = "checkpoints/retrievals.sqlite"
+
+SIMILARITY_QUANTILES = [0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0]
+
+
+# =========================
+# Store
+# =========================
+class RetrievalStore:
+    """
+    Per-clip retrieval results keyed by (file_name, KB version id).
+
+    Only exemplar indices, similarities and the scoring tier are stored; they
+    refer to the KB's exemplar list, which the version id pins down (see
+    noise_retrieval.kb_version). A result retrieved at topk serves any request
+    for k <= topk.
+    """
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS retrievals ("
+            " file_name TEXT NOT NULL,"
+            " kb_version TEXT NOT NULL,"
+            " topk INTEGER NOT NULL,"
+            " results TEXT NOT NULL,"
+            " created TEXT NOT NULL,"
+            " PRIMARY KEY (file_name, kb_version))"
+        )
+        self.conn.commit()
+
+    def get(self, file_name: str, kb_version: str, topk: int) -> Optional[List[Dict]]:
+        """
+        return: [{"index", "similarity", "tier"}, ...] best first, or None when
+        the clip was not retrieved under kb_version with at least topk results.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT topk, results FROM retrievals WHERE file_name = ? AND kb_version = ?",
+                (file_name, kb_version),
+            ).fetchone()
+        if row is None or row[0] < topk:
+            return None
+        return json.loads(row[1])[:topk]
+
+    def put(self, file_name: str, kb_version: str, topk: int, results: List[Dict]):
+        """
+        results: retrieve() output; needs "index" and "similarity" per exemplar.
+        """
+        compact = [
+            {"index": int(r["index"]), "similarity": float(r["similarity"]), "tier": r.get("tier", "beats")}
+            for r in results
+        ]
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO retrievals VALUES (?, ?, ?, ?, ?)",
+                (file_name, kb_version, topk, json.dumps(compact),
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            self.conn.commit()
+
+    def versions(self) -> List[tuple]:
+        """
+        [(kb_version, clips, last written), ...] most recent first.
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT kb_version, COUNT(*), MAX(created) FROM retrievals"
+                " GROUP BY kb_version ORDER BY MAX(created) DESC"
+            ).fetchall()
+
+    def rows(self, kb_version: str) -> Dict[str, List[Dict]]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT file_name, results FROM retrievals WHERE kb_version = ?", (kb_version,)
+            ).fetchall()
+        return {name: json.loads(results) for name, results in rows}
+
+    def close(self):
+        self.conn.close()
+
+
+def expand(results: List[Dict], exemplars: List[Dict]) -> List[Dict]:
+    """
+    Stored results -> retrieve()-style dicts with each exemplar's audio_path and caption.
+    exemplars: the KB's exemplar list, in KB order.
+    """
+    return [
+        {
+            "index": r["index"],
+            "audio_path": exemplars[r["index"]]["audio_path"],
+            "caption": exemplars[r["index"]]["caption"],
+            "similarity": r["similarity"],
+            "tier": r["tier"],
+        }
+        for r in results
+    ]
+
+
+# =========================
+# Inspect
+# =========================
+def summarize(rows: Dict[str, List[Dict]], exemplars: Optional[List[Dict]] = None, top: int = 10) -> List[str]:
+    """
+    Distribution of stored retrievals: result counts, tiers, top-1 similarity
+    quantiles per tier and the most retrieved exemplars.
+    """
+    lines = [f"clips: {len(rows)}"]
+    counts = Counter(len(r) for r in rows.values())
+    lines.append("results per clip: " + ", ".join(f"{k}: {counts[k]}" for k in sorted(counts)))
+
+    tiers = Counter(r[0]["tier"] for r in rows.values() if r)
+    lines.append("top-1 tier: " + ", ".join(f"{t}: {n}" for t, n in tiers.most_common()))
+    for tier in tiers:
+        sims = np.array([r[0]["similarity"] for r in rows.values() if r and r[0]["tier"] == tier])
+        qs = np.quantile(sims, SIMILARITY_QUANTILES)
+        lines.append(f"top-1 similarity ({tier}): " + ", ".join(
+            f"q{int(q * 100)}={v:.3f}" for q, v in zip(SIMILARITY_QUANTILES, qs)
+        ))
+
+    ranked = Counter(r[0]["index"] for r in rows.values() if r)
+    lines.append(f"most retrieved top-1 exemplars ({len(ranked)} distinct):")
+    for index, n in ranked.most_common(top):
+        name = exemplars[index]["audio_path"] if exemplars and index < len(exemplars) else f"#{index}"
+        lines.append(f"  {n:6d}  {name}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect stored per-clip noise retrievals.")
+    parser.add_argument("--store", default=STORE_PATH)
+    parser.add_argument("--version", default="", help="KB version id (default: the most recently written)")
+    parser.add_argument("--noise-list", default="", help="noise list JSON, to print exemplar paths")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    store = RetrievalStore(args.store)
+    versions = store.versions()
+    if not versions:
+        print(f"{args.store} is empty")
+        return
+    for version, clips, created in versions:
+        print(f"{version}  {clips:6d} clips  last written {created}")
+
+    version = args.version or versions[0][0]
+    exemplars = None
+    if args.noise_list:
+        with open(args.noise_list, "r", encoding="utf-8") as f:
+            exemplars = json.load(f)
+    print(f"\n[{version}]")
+    print("\n".join(summarize(store.rows(version), exemplars, top=args.top)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
 import os
 import csv
+import json
 import time
 import base64
+import argparse
+import functools
+import contextlib
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from tqdm import tqdm
-from openai import OpenAI
-import noise_retrieval as noise_retrieval
+import result_store
+
+# torch / BEATs / openai are imported on first use, so --help, --dry-run and a
+# finished --resume start instantly
 
 API_BASE = ""
 API_KEY = ""
@@ -35,91 +43,238 @@ OUTPUT_CSV = f"{OUTPUT_DIR}/clotho_inference_results_ICL_RAG_1.csv"
 
 SLEEP_BETWEEN_REQ = 0.3
 
-client = OpenAI(api_key=API_KEY, base_url=API_BASE)
-
-BEATS_CKPT = "/home/org/ALM-HALL/benchmark/audio-hallucination/clotho/description_task_V7/rag/BEATs_iter3_plus_AS2M_finetuned_on_AS2M_cpt2.pt"
-
-noise_kb = noise_retrieval.NoiseKnowledgeBase(BEATS_CKPT)
-
-noise_metadata = [
-        {
-            "audio_path": "data/noise/noise_flat.wav",
-            "caption": "Steady broadband noise with a flat spectrum; no distinct transients or tonal components."
-        },
-        {
-            "audio_path": "data/noise/noise_high_bias.wav",
-            "caption": "Steady broadband noise dominated by high frequencies (hiss-like); no distinct events or tones."
-        },
-        {
-            "audio_path": "data/noise/noise_low_bias.wav",
-            "caption": "Steady broadband noise dominated by low frequencies (rumble-like); no distinct events or tones."
-        },
-        {
-            "audio_path": "data/noise/noise_random_shape.wav",
-            "caption": "Steady broadband noise with an uneven spectrum; no clear transient events or stable tones."
-        },
-        {
-            "audio_path": "data/noise/bubble_noise.wav",
-            "caption": "Irregular synthetic noise with unstable, bubble-like temporal patterns and an atypical spectrum; no identifiable acoustic events or tonal structure."
-        },
-        {
-            "audio_path": "data/noise/silence_device_hum.wav",
-            "caption": "Near-silent audio with extremely low energy and a faint, steady background hum; no discernible events or sound sources."
-        },
-        {
-            "audio_path": "data/noise/pink_noise.wav",
-            "caption": "Continuous broadband noise with stronger low-frequency energy following a 1/f distribution; no distinct events or tonal components."
-        },
-        {
-            "audio_path": "data/noise/bandpass_noise.wav",
-            "caption": "Narrow-band noise concentrated within a limited frequency range; no clear transient events or stable tonal patterns."
-        },
-        {
-            "audio_path": "data/noise/modulated_noise.wav",
-            "caption": "Broadband noise with periodic amplitude modulation over time; no structured rhythm, events, or identifiable sound sources."
-        },
-        {
-            "audio_path": "data/noise/glitch_noise.wav",
-            "caption": "Synthetic digital glitch-like noise with abrupt discontinuities and non-natural spectral artifacts; no recognizable acoustic events."
-        }
-    ]
-
-noise_kb.build_from_list(noise_metadata)
-
-def infer_audio(audio_path: str) -> str:
-    try:
-        with open(audio_path, "rb") as f:
-            audio_base64 = base64.b64encode(f.read()).decode("utf-8")
-
-        retrieved_noises = noise_kb.retrieve(audio_path, topk=4)
+# pipelined driver: BEATs retrieval runs this many clips ahead of the ALM requests,
+# of which up to CONCURRENT_REQUESTS are in flight at once
+RETRIEVAL_AHEAD = 8
+CONCURRENT_REQUESTS = 4
 
+# "csv" or "parquet"; parquet is converted from the CSV once inference finishes
+OUTPUT_FORMAT = "csv"
 
+BEATS_CKPT = "/home/org/ALM-HALL/benchmark/audio-hallucination/clotho/description_task_V7/rag/BEATs_iter3_plus_AS2M_finetuned_on_AS2M_cpt2.pt"
 
-        messages = [
-            {"role": "system", "content": PROMPT_TEXT}
-        ]
+# cached noise exemplar embeddings; only new or changed exemplars are re-encoded
+NOISE_EMB_STORE = "checkpoints/noise_kb_embeddings.npz"
+
+# how query clips are embedded for retrieval (noise_retrieval.QueryPolicy fields);
+# mode="crops" encodes a few short high-energy crops instead of the whole clip
+QUERY_POLICY = dict(mode="full", n_crops=3, crop_seconds=2.0)
+
+# BEATs layer to pool for retrieval (0-based); None runs all layers.
+# Check agreement with `python encoder_benchmarks.py layers` before lowering it.
+BEATS_LAYER = None
+# "fp32", "bf16" or "int8"; check drift with `python encoder_benchmarks.py precision`
+BEATS_PRECISION = "fp32"
+# torch.compile the encoder; every length bucket is compiled once at startup
+BEATS_COMPILE = False
+# encode clips longer than this many seconds as overlapping windows of that length,
+# BEATS_CHUNK_HOP_SECONDS apart (bounds encoder memory); None encodes clips whole.
+# Check agreement with `python encoder_benchmarks.py chunked` before enabling it.
+BEATS_CHUNK_SECONDS = None
+BEATS_CHUNK_HOP_SECONDS = 5.0
+
+# prefix written by build_audio_shard.py; "" decodes every clip from its WAV file
+AUDIO_SHARD_PREFIX = ""
+
+# cheap spectral tier before BEATs: clear matches skip the BEATs forward, everything
+# else is ranked by BEATs and gated by EXEMPLAR_MIN_SIMILARITY as usual (check with `python encoder_benchmarks.py prefilter`)
+SPECTRAL_PREFILTER = False
+
+# noise exemplars (audio_path + caption) used as in-context examples
+NOISE_LIST = "data/noise_list.json"
+
+# URL of a running embedding_service.py; "" loads BEATs and the KB in-process
+EMBEDDING_SERVICE_URL = ""
+
+# prefix written by precompute_query_embeddings.py; "" encodes each query clip on the fly
+QUERY_EMB_PREFIX = ""
+
+# per-clip retrieval results keyed by file_name and KB version, shared by every ALM /
+# prompt run on the same KB ("" = retrieve every time); inspect with retrieval_store.py
+RETRIEVAL_STORE = "checkpoints/retrievals.sqlite"
+
+# adaptive exemplar count: up to EXEMPLAR_MAX_K exemplars whose similarity to the
+# query is at least EXEMPLAR_MIN_SIMILARITY (None = always EXEMPLAR_MAX_K).
+# Pick the threshold with adaptive_topk_report.py.
+EXEMPLAR_MAX_K = 4
+EXEMPLAR_MIN_SIMILARITY = None
+
+# --sweep: exemplar counts captioned from one retrieval at max(SWEEP_KS); rows are
+# written long-format with a k column (HR by k: python calculate.py <evaluated sweep>)
+SWEEP_KS = [0, 1, 2, 4, 8]
+SWEEP_COLUMN = "k"
+SWEEP_OUTPUT_CSV = f"{OUTPUT_DIR}/clotho_inference_results_ICL_RAG_sweep.csv"
+
+
+# =========================
+# Lazily built resources
+# =========================
+# seconds spent in each startup stage, in the order they ran
+STARTUP_PROFILE = {}
+
+
+@contextlib.contextmanager
+def profiled(stage: str):
+    t = time.perf_counter()
+    yield
+    STARTUP_PROFILE[stage] = time.perf_counter() - t
+    print(f"[startup] {stage}: {STARTUP_PROFILE[stage]:.2f}s")
+
+
+@functools.lru_cache(maxsize=None)
+def get_client():
+    with profiled("openai client"):
+        from openai import OpenAI
+        return OpenAI(api_key=API_KEY, base_url=API_BASE)
+
+
+@functools.lru_cache(maxsize=None)
+def import_beats():
+    """
+    The noise_retrieval module; importing it pulls in torch and BEATs, so the
+    first caller profiles the import.
+    """
+    with profiled("import torch / BEATs"):
+        import audio_io
+        import noise_retrieval as noise_retrieval
+    return noise_retrieval
+
+
+@functools.lru_cache(maxsize=None)
+def get_noise_list():
+    with open(NOISE_LIST, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@functools.lru_cache(maxsize=None)
+def get_noise_kb():
+    """
+    The noise KB (or a client of the embedding service), built on first retrieval.
+    """
+    if EMBEDDING_SERVICE_URL:
+        noise_retrieval = import_beats()
+        with profiled("embedding service"):
+            import embedding_service
+            return embedding_service.EmbeddingClient(
+                EMBEDDING_SERVICE_URL, query_policy=noise_retrieval.QueryPolicy(**QUERY_POLICY),
+                prefilter=SPECTRAL_PREFILTER,
+            )
+
+    noise_retrieval = import_beats()
+    if AUDIO_SHARD_PREFIX:
+        import audio_io
+        with profiled("audio shard"):
+            audio_io.open_shard(AUDIO_SHARD_PREFIX)
+    with profiled("load BEATs"):
+        noise_kb = noise_retrieval.NoiseKnowledgeBase(
+            BEATS_CKPT, store_path=NOISE_EMB_STORE, query_policy=noise_retrieval.QueryPolicy(**QUERY_POLICY),
+            layer=BEATS_LAYER, precision=BEATS_PRECISION, compiled=BEATS_COMPILE,
+            chunk_seconds=BEATS_CHUNK_SECONDS, chunk_hop_seconds=BEATS_CHUNK_HOP_SECONDS,
+        )
+    if BEATS_COMPILE:
+        with profiled("compile warmup"):
+            noise_kb.encoder.warmup()
+    with profiled("build noise KB"):
+        noise_kb.build_from_list(get_noise_list())
+    if SPECTRAL_PREFILTER:
+        with profiled("spectral pre-filter"):
+            noise_kb.enable_prefilter()
+    return noise_kb
+
+
+@functools.lru_cache(maxsize=None)
+def get_query_store():
+    if not QUERY_EMB_PREFIX:
+        return None
+    noise_kb = get_noise_kb()
+    with profiled("query embeddings"):
+        import noise_retrieval as noise_retrieval
+        return noise_retrieval.QueryEmbeddingStore(
+            QUERY_EMB_PREFIX, noise_kb.fingerprint, noise_retrieval.QueryPolicy(**QUERY_POLICY)
+        )
 
-        for n in retrieved_noises:
-            with open(n["audio_path"], "rb") as f:
-                noise_b64 = base64.b64encode(f.read()).decode("utf-8")
 
-            messages.append({
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "Now caption the next audio. Follow the same rules."},
-                    {
-                        "type": "audio_url",
-                        "audio_url": {
-                            "url": f"data:audio/wav;base64,{noise_b64}"
-                        }
-                    },
-                ],
-            })
+@functools.lru_cache(maxsize=None)
+def get_retrieval_store():
+    """
+    (store, KB version, base version) or None. The versions are derived from the
+    configuration, so clips already in the store never load BEATs. The base
+    version leaves out QUERY_EMB_PREFIX and keys clips encoded on the fly.
+    """
+    if not RETRIEVAL_STORE:
+        return None
+    noise_retrieval = import_beats()
+    if EMBEDDING_SERVICE_URL:
+        version = get_noise_kb().version
+    else:
+        with profiled("checkpoint fingerprint"):
+            checkpoint_fp = noise_retrieval.checkpoint_fingerprint(BEATS_CKPT)
+        with profiled("KB version"):
+            import spectral_prefilter
+            version = noise_retrieval.kb_version(
+                noise_retrieval.encoder_fingerprint(
+                    checkpoint_fp, BEATS_LAYER, BEATS_PRECISION, BEATS_CHUNK_SECONDS, BEATS_CHUNK_HOP_SECONDS,
+                ),
+                get_noise_list(),
+                noise_retrieval.QueryPolicy(**QUERY_POLICY),
+                {"prefilter": spectral_prefilter.SpectralPrefilter().params} if SPECTRAL_PREFILTER else {},
+            )
+    base_version = version
+    if QUERY_EMB_PREFIX:
+        # precomputed query embeddings bypass the in-process query policy and pre-filter
+        source = noise_retrieval.QueryEmbeddingStore(QUERY_EMB_PREFIX).source
+        version = noise_retrieval.extend_version(version, {"query_embeddings": source})
+    with profiled("retrieval store"):
+        import retrieval_store
+        return retrieval_store.RetrievalStore(RETRIEVAL_STORE), version, base_version
+
+
+def retrieve(audio_path: str, topk: int = EXEMPLAR_MAX_K):
+    """
+    The topk exemplars closest to the clip, best first; read from the
+    retrieval store when possible.
+    """
+    import retrieval_store
+    file_name = os.path.basename(audio_path)
+    store = get_retrieval_store()
+    stored = store[0].get(file_name, store[1], topk) if store else None
+    if stored is not None:
+        return retrieval_store.expand(stored, get_noise_list())
+
+    query_store = get_query_store()
+    query_emb = query_store.get(file_name) if query_store else None
+    version = store[1] if store else None
+    if store and query_emb is None:
+        # clips missing from the query store are encoded on the fly, as without QUERY_EMB_PREFIX
+        version = store[2]
+        stored = store[0].get(file_name, version, topk)
+        if stored is not None:
+            return retrieval_store.expand(stored, get_noise_list())
+    retrieved = get_noise_kb().retrieve(audio_path, topk=topk, query_embedding=query_emb)
+    if store:
+        store[0].put(file_name, version, topk, retrieved)
+    return retrieved
+
+
+def gate(retrieved, k: int = EXEMPLAR_MAX_K):
+    """
+    The exemplars put in the prompt: at most k of retrieved, gated by EXEMPLAR_MIN_SIMILARITY.
+    """
+    import noise_retrieval as noise_retrieval
+    return noise_retrieval.gate_exemplars(retrieved, EXEMPLAR_MIN_SIMILARITY, k)
+
+
+def request_caption(audio_path: str, exemplars) -> str:
+    with open(audio_path, "rb") as f:
+        audio_base64 = base64.b64encode(f.read()).decode("utf-8")
+
+    messages = [
+        {"role": "system", "content": PROMPT_TEXT}
+    ]
 
-            messages.append({
-                "role": "assistant",
-                "content": n["caption"],
-            })
+    for n in exemplars:
+        with open(n["audio_path"], "rb") as f:
+            noise_b64 = base64.b64encode(f.read()).decode("utf-8")
 
         messages.append({
             "role": "user",
@@ -128,28 +283,143 @@ def infer_audio(audio_path: str) -> str:
                 {
                     "type": "audio_url",
                     "audio_url": {
-                        "url": f"data:audio/wav;base64,{audio_base64}"
+                        "url": f"data:audio/wav;base64,{noise_b64}"
                     }
                 },
             ],
         })
 
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=messages,
-            temperature=0.0,
-            max_tokens=1024,
-        )
-
-        return response.choices[0].message.content.strip()
+        messages.append({
+            "role": "assistant",
+            "content": n["caption"],
+        })
 
+    messages.append({
+        "role": "user",
+        "content": [
+            {"type": "text", "text": "Now caption the next audio. Follow the same rules."},
+            {
+                "type": "audio_url",
+                "audio_url": {
+                    "url": f"data:audio/wav;base64,{audio_base64}"
+                }
+            },
+        ],
+    })
+
+    response = get_client().chat.completions.create(
+        model=MODEL_NAME,
+        messages=messages,
+        temperature=0.0,
+        max_tokens=1024,
+    )
+
+    return response.choices[0].message.content.strip()
+
+
+# =========================
+# Pipelined driver
+# =========================
+def caption_or_error(audio_path: str, exemplars) -> str:
+    try:
+        return request_caption(audio_path, exemplars)
     except Exception as e:
         return f"[ERROR] {e}"
 
 
+def pipelined(jobs, retrieval_ahead: int = RETRIEVAL_AHEAD, concurrency: int = CONCURRENT_REQUESTS):
+    """
+    jobs: (audio_path, ks) pairs; each clip is captioned once per k in ks.
+    Yield (retrieved, [(caption, n_used) for each k]) per job, in order.
+
+    One worker thread retrieves (once, at max(ks)) up to retrieval_ahead
+    clips ahead of the request stage, which keeps up to `concurrency` ALM
+    requests in flight, so BEATs runs while the network waits. All of a
+    clip's k variants are requested together. Request starts are spaced by
+    SLEEP_BETWEEN_REQ.
+    """
+    get_client()  # create it once, before the request threads race for it
+    jobs = iter(jobs)
+    retrievals, requests = deque(), deque()
+    in_flight = 0
+    last_start = 0.0
+    with ThreadPoolExecutor(max_workers=1) as retrieval_pool, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as request_pool:
+        while True:
+            while len(retrievals) < max(1, retrieval_ahead):
+                job = next(jobs, None)
+                if job is None:
+                    break
+                path, ks = job
+                retrievals.append((path, ks, retrieval_pool.submit(retrieve, path, max(ks))))
+            if not retrievals and not requests:
+                return
+
+            if retrievals and (not requests or in_flight + len(retrievals[0][1]) <= concurrency):
+                path, ks, future = retrievals.popleft()
+                try:
+                    retrieved = future.result()
+                except Exception as e:
+                    # nothing was submitted, so the failed variants are not in flight
+                    done = Future()
+                    done.set_result(f"[ERROR] {e}")
+                    requests.append(([], [(done, 0)] * len(ks), 0))
+                    continue
+                variants = []
+                for k in ks:
+                    used = gate(retrieved, k)
+                    time.sleep(max(0.0, last_start + SLEEP_BETWEEN_REQ - time.monotonic()))
+                    last_start = time.monotonic()
+                    variants.append((request_pool.submit(caption_or_error, path, used), len(used)))
+                requests.append((retrieved, variants, len(variants)))
+                in_flight += len(variants)
+                continue
+
+            retrieved, variants, submitted = requests.popleft()
+            in_flight -= submitted
+            yield retrieved, [(future.result(), n_used) for future, n_used in variants]
+
+
+def pending_samples(work, output_csv: str, sweep: bool = False):
+    """
+    The (item, ks) work not yet in output_csv; repeated file_names are matched
+    by occurrence. A sweep output has one row per (file_name, k).
+    """
+    columns = ["file_name", SWEEP_COLUMN] if sweep else ["file_name"]
+    done = Counter(
+        tuple(row.get(c, "") for c in columns) for row in result_store.iter_rows(output_csv, columns=columns)
+    )
+    pending = []
+    for item, ks in work:
+        left = []
+        for k in ks:
+            key = (item["file_name"], str(k)) if sweep else (item["file_name"],)
+            if done[key] > 0:
+                done[key] -= 1
+            else:
+                left.append(k)
+        if left:
+            pending.append((item, left))
+    return pending
+
 
 def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    parser = argparse.ArgumentParser(description="NIC (noise in-context) ALM captioning on the Clotho benchmark.")
+    parser.add_argument("--output", default=None, help=f"default: {OUTPUT_CSV} ({SWEEP_OUTPUT_CSV} with --sweep)")
+    parser.add_argument("--limit", type=int, default=0, help="process at most this many clips (0 = all)")
+    parser.add_argument("--resume", action="store_true", help="append to --output, skipping clips already in it")
+    parser.add_argument("--dry-run", action="store_true", help="list the work without loading BEATs or calling the API")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENT_REQUESTS, help="ALM requests in flight")
+    parser.add_argument("--retrieval-ahead", type=int, default=RETRIEVAL_AHEAD,
+                        help="clips retrieved ahead of the request stage")
+    parser.add_argument("--sweep", type=int, nargs="*", default=None, metavar="K",
+                        help=f"caption every clip once per exemplar count K (no values: {SWEEP_KS}) "
+                             f"into one long-format output with a k column")
+    args = parser.parse_args()
+
+    sweep = args.sweep is not None
+    ks = sorted(set(args.sweep or SWEEP_KS)) if sweep else [EXEMPLAR_MAX_K]
+    output = args.output or (SWEEP_OUTPUT_CSV if sweep else OUTPUT_CSV)
 
     with open(META_CSV, "r", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -157,34 +427,80 @@ def main():
 
     print(len(samples))
 
-    fieldnames = list(samples[0].keys()) + ["model_caption", "model_name", "timestamp"]
-
-    with open(OUTPUT_CSV, "w", newline="", encoding="utf-8") as f_out:
-        writer = csv.DictWriter(f_out, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for item in tqdm(samples, desc="Running ALM inference"):
-
+    fieldnames = result_store.output_fieldnames(samples[0].keys()) + [
+        "model_caption", "model_name", "timestamp",
+    ] + ([SWEEP_COLUMN] if sweep else []) + ["n_exemplars", "retrieved_exemplars"]
+    work = [(item, ks) for item in samples]
+
+    resume = args.resume and os.path.exists(output) and os.path.getsize(output) > 0
+    if resume:
+        # keep appending under the existing header, whatever columns it has
+        fieldnames = result_store.read_fieldnames(output)
+        if sweep and SWEEP_COLUMN not in fieldnames:
+            parser.error(f"{output} has no {SWEEP_COLUMN} column; it is not a --sweep output")
+        work = pending_samples(work, output, sweep=sweep)
+        print(f"resuming {output}: {len(work)} clips left")
+    if args.limit:
+        work = work[:args.limit]
+
+    if args.dry_run:
+        missing = [item["file_name"] for item, _ in work
+                   if not os.path.exists(os.path.join(AUDIO_ROOT, item["file_name"]))]
+        requests = sum(len(k) for item, k in work if item["file_name"] not in missing)
+        print(f"would caption {len(work) - len(missing)} clips ({requests} requests, k={ks}) into {output} "
+              f"({len(missing)} missing audio)")
+        for name in missing:
+            print(os.path.join(AUDIO_ROOT, name))
+        return
+    if not work:
+        print("nothing to do")
+        return
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "a" if resume else "w", newline="", encoding="utf-8") as f_out:
+        writer = csv.DictWriter(f_out, fieldnames=fieldnames, extrasaction="ignore")
+        if not resume:
+            writer.writeheader()
+
+        present = []
+        for item, item_ks in work:
             audio_path = os.path.join(AUDIO_ROOT, item["file_name"])
-
-            if not os.path.exists(audio_path):
+            if os.path.exists(audio_path):
+                present.append((item, item_ks))
+            else:
                 print(audio_path)
-                continue
 
-            caption = infer_audio(audio_path)
+        results = pipelined(
+            [(os.path.join(AUDIO_ROOT, item["file_name"]), item_ks) for item, item_ks in present],
+            # a clip's k variants are always requested together
+            retrieval_ahead=args.retrieval_ahead, concurrency=max(args.concurrency, len(ks)),
+        )
+        for (item, item_ks), (retrieved, variants) in tqdm(
+                zip(present, results), total=len(present), desc="Running ALM inference"):
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            item_out = dict(item)
-            item_out["model_caption"] = caption
-            item_out["model_name"] = MODEL_NAME
-            item_out["timestamp"] = timestamp
-
-            writer.writerow(item_out)
+            retrieved_json = json.dumps(
+                [{"audio_path": r["audio_path"], "similarity": round(r["similarity"], 4), "tier": r.get("tier", "beats")}
+                 for r in retrieved],
+                ensure_ascii=False,
+            )
+
+            for k, (caption, n_used) in zip(item_ks, variants):
+                item_out = dict(item)
+                item_out["model_caption"] = caption
+                item_out["model_name"] = MODEL_NAME
+                item_out["timestamp"] = timestamp
+                item_out[SWEEP_COLUMN] = k
+                item_out["n_exemplars"] = n_used
+                item_out["retrieved_exemplars"] = retrieved_json
+                writer.writerow(item_out)
             f_out.flush()
 
-            time.sleep(SLEEP_BETWEEN_REQ)
+    if STARTUP_PROFILE:
+        print(f"[startup] total: {sum(STARTUP_PROFILE.values()):.2f}s")
+    print(f"{output}")
 
-    print(f"{OUTPUT_CSV}")
+    if OUTPUT_FORMAT == "parquet":
+        print(result_store.csv_to_parquet(output))
 
 
 if __name__ == "__main__":
@@ -5,6 +5,7 @@ import base64
 from datetime import datetime
 from tqdm import tqdm
 from openai import OpenAI
+import result_store
 
 API_BASE = ""
 API_KEY = ""
@@ -34,6 +35,9 @@ OUTPUT_CSV = f""
 
 SLEEP_BETWEEN_REQ = 0.3
 
+# "csv" or "parquet"; parquet is converted from the CSV once inference finishes
+OUTPUT_FORMAT = "csv"
+
 client = OpenAI(api_key=API_KEY, base_url=API_BASE)
 
 
@@ -79,10 +83,10 @@ def main():
 
     print("📊 待处理音频数量:", len(samples))
 
-    fieldnames = list(samples[0].keys()) + ["model_caption", "model_name", "timestamp"]
+    fieldnames = result_store.output_fieldnames(samples[0].keys()) + ["model_caption", "model_name", "timestamp"]
 
     with open(OUTPUT_CSV, "w", newline="", encoding="utf-8") as f_out:
-        writer = csv.DictWriter(f_out, fieldnames=fieldnames)
+        writer = csv.DictWriter(f_out, fieldnames=fieldnames, extrasaction="ignore")
         writer.writeheader()
 
         for item in tqdm(samples, desc="Running ALM inference"):
@@ -108,6 +112,9 @@ def main():
 
     print(f"{OUTPUT_CSV}")
 
+    if OUTPUT_FORMAT == "parquet":
+        print(result_store.csv_to_parquet(OUTPUT_CSV))
+
 
 if __name__ == "__main__":
     main()
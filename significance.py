@@ -0,0 +1,317 @@
+import csv
+import math
+import argparse
+import itertools
+import numpy as np
+from typing import Dict, List
+
+import calculate as calc
+import result_store
+
+
+N_RESAMPLES = 2000
+ALPHA = 0.05
+SEED = 0
+# bootstrap replicates materialized at once; bounds memory to BATCH x N weights
+BATCH = 500
+
+HALLUCINATION_TYPES = [
+    "ACOUSTIC_ATTRIBUTE",
+    "SOURCE_MATERIAL",
+    "PRIOR_DRIVEN",
+    "FABRICATED_EVENT",
+]
+
+
+# =========================
+# Per-sample arrays
+# =========================
+def load_samples(csv_path: str) -> Dict[str, np.ndarray]:
+    """
+    Load one evaluated results file (CSV or Parquet) as per-sample arrays:
+        file_name: (N,) str
+        hall:      (N,) float, 1.0 if hallucinated
+        types:     (N, len(HALLUCINATION_TYPES)) float indicators
+        lexical:   (N, 3) float, event / definite / acoustic frequency
+    """
+    # without file_name every row would pair by position in align()
+    if "file_name" not in result_store.read_fieldnames(csv_path):
+        raise ValueError(f"{csv_path} has no file_name column")
+
+    names, hall, types, lexical = [], [], [], []
+    for row in result_store.iter_rows(csv_path, columns=calc.METRIC_COLUMNS):
+        names.append(row.get("file_name", ""))
+        hall.append(calc.parse_hallucination_flag(row.get("hallucination_detected", "")))
+        row_types = set(calc.parse_hallucination_types(row.get("hallucination_types", "")))
+        types.append([t in row_types for t in HALLUCINATION_TYPES])
+        freqs = calc.lexical_freqs(row.get("model_caption") or "")
+        lexical.append([freqs[key] for key, _ in calc.LEXICAL_CATEGORIES])
+
+    return {
+        "file_name": np.array(names, dtype=object),
+        "hall": np.array(hall, dtype=np.float64),
+        "types": np.array(types, dtype=np.float64).reshape(-1, len(HALLUCINATION_TYPES)),
+        "lexical": np.array(lexical, dtype=np.float64).reshape(-1, len(calc.LEXICAL_CATEGORIES)),
+    }
+
+
+def stat_names() -> List[str]:
+    lex = [key for key, _ in calc.LEXICAL_CATEGORIES]
+    return (
+        ["hr"]
+        + [f"type_all/{t}" for t in HALLUCINATION_TYPES]
+        + [f"type_hall/{t}" for t in HALLUCINATION_TYPES]
+        + [f"lex_all/{k}" for k in lex]
+        + [f"lex_hall/{k}" for k in lex]
+    )
+
+
+def weighted_stats(samples: Dict[str, np.ndarray], weights: np.ndarray) -> np.ndarray:
+    """
+    Compute every statistic in `stat_names()` for a batch of resampling weights.
+    weights: (B, N) resample counts (a row of ones gives the point estimate)
+    return: (B, S)
+    """
+    hall = samples["hall"]
+    per_sample = np.concatenate([samples["types"], samples["lexical"]], axis=1)  # (N, M)
+
+    n = weights.sum(axis=1, keepdims=True)
+    n_hall = weights @ hall                                                   # (B,)
+    sums_all = weights @ per_sample                                           # (B, M)
+    sums_hall = weights @ (per_sample * hall[:, None])                        # (B, M)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_all = sums_all / n
+        mean_hall = np.where(n_hall[:, None] > 0, sums_hall / n_hall[:, None], 0.0)
+
+    n_types = samples["types"].shape[1]
+    return np.concatenate(
+        [
+            (n_hall / n[:, 0])[:, None],
+            mean_all[:, :n_types],
+            mean_hall[:, :n_types],
+            mean_all[:, n_types:],
+            mean_hall[:, n_types:],
+        ],
+        axis=1,
+    )
+
+
+def resample_weights(rng: np.random.Generator, n: int, size: int) -> np.ndarray:
+    """
+    (size, n) bootstrap counts; each row sums to n.
+    """
+    return rng.multinomial(n, np.full(n, 1.0 / n), size=size).astype(np.float64)
+
+
+# =========================
+# Bootstrap confidence intervals
+# =========================
+def bootstrap_ci(
+        samples: Dict[str, np.ndarray],
+        n_resamples: int = N_RESAMPLES,
+        alpha: float = ALPHA,
+        seed: int = SEED,
+) -> Dict[str, tuple]:
+    """
+    Percentile bootstrap CIs for HR, type proportions and lexical frequencies.
+    Each batch of replicates is one (B, N) @ (N, M) product.
+    return: {stat_name: (point, lo, hi)}
+    """
+    n = len(samples["hall"])
+    if n == 0:
+        return {}
+
+    rng = np.random.default_rng(seed)
+    point = weighted_stats(samples, np.ones((1, n)))[0]
+
+    reps = []
+    for start in range(0, n_resamples, BATCH):
+        w = resample_weights(rng, n, min(BATCH, n_resamples - start))
+        reps.append(weighted_stats(samples, w))
+    reps = np.concatenate(reps, axis=0)
+
+    lo, hi = np.nanquantile(reps, [alpha / 2, 1 - alpha / 2], axis=0)
+    return {
+        name: (float(point[i]), float(lo[i]), float(hi[i]))
+        for i, name in enumerate(stat_names())
+    }
+
+
+# =========================
+# Paired tests
+# =========================
+def align(a: Dict[str, np.ndarray], b: Dict[str, np.ndarray]):
+    """
+    Restrict two sample sets to their common file_names, in the same order.
+    Repeated file_names are paired by order of occurrence.
+    """
+    def keyed(names):
+        seen = {}
+        for name in names:
+            seen[name] = seen.get(name, -1) + 1
+            yield name, seen[name]
+
+    index_b = {key: i for i, key in enumerate(keyed(b["file_name"]))}
+    idx_a, idx_b = [], []
+    for i, key in enumerate(keyed(a["file_name"])):
+        j = index_b.get(key)
+        if j is not None:
+            idx_a.append(i)
+            idx_b.append(j)
+    idx_a, idx_b = np.array(idx_a, dtype=np.int64), np.array(idx_b, dtype=np.int64)
+    take = lambda s, idx: {k: v[idx] for k, v in s.items()}
+    return take(a, idx_a), take(b, idx_b)
+
+
+def mcnemar_test(hall_a: np.ndarray, hall_b: np.ndarray) -> Dict[str, float]:
+    """
+    Exact McNemar test on paired hallucination flags
+    (normal approximation with continuity correction for > 10000 discordant pairs).
+    """
+    n01 = int(np.sum((hall_a > 0) & (hall_b == 0)))
+    n10 = int(np.sum((hall_a == 0) & (hall_b > 0)))
+    n = n01 + n10
+    if n == 0:
+        p = 1.0
+    elif n > 10000:
+        chi2 = (abs(n01 - n10) - 1) ** 2 / n
+        p = math.erfc(math.sqrt(chi2 / 2))
+    else:
+        k = min(n01, n10)
+        log_terms = [
+            math.lgamma(n + 1) - math.lgamma(i + 1) - math.lgamma(n - i + 1) - n * math.log(2)
+            for i in range(k + 1)
+        ]
+        top = max(log_terms)
+        cdf = math.exp(top) * sum(math.exp(t - top) for t in log_terms)
+        p = min(1.0, 2 * cdf)
+    return {"a_only": n01, "b_only": n10, "p_value": p}
+
+
+def paired_bootstrap(
+        a: Dict[str, np.ndarray],
+        b: Dict[str, np.ndarray],
+        n_resamples: int = N_RESAMPLES,
+        alpha: float = ALPHA,
+        seed: int = SEED,
+) -> Dict[str, tuple]:
+    """
+    Paired bootstrap of (b - a) for every statistic, resampling aligned clips jointly.
+    return: {stat_name: (diff, lo, hi, p_value)}
+    """
+    n = len(a["hall"])
+    if n == 0:
+        return {}
+
+    rng = np.random.default_rng(seed)
+    ones = np.ones((1, n))
+    point = weighted_stats(b, ones)[0] - weighted_stats(a, ones)[0]
+
+    reps = []
+    for start in range(0, n_resamples, BATCH):
+        w = resample_weights(rng, n, min(BATCH, n_resamples - start))
+        reps.append(weighted_stats(b, w) - weighted_stats(a, w))
+    reps = np.concatenate(reps, axis=0)
+
+    lo, hi = np.nanquantile(reps, [alpha / 2, 1 - alpha / 2], axis=0)
+    # two-sided: how often the resampled difference falls on either side of zero
+    p = np.minimum(1.0, 2 * np.minimum((reps <= 0).mean(axis=0), (reps >= 0).mean(axis=0)))
+    return {
+        name: (float(point[i]), float(lo[i]), float(hi[i]), float(p[i]))
+        for i, name in enumerate(stat_names())
+    }
+
+
+def compare_pair(
+        a: Dict[str, np.ndarray],
+        b: Dict[str, np.ndarray],
+        n_resamples: int = N_RESAMPLES,
+        seed: int = SEED,
+) -> dict:
+    a, b = align(a, b)
+    boot = paired_bootstrap(a, b, n_resamples=n_resamples, seed=seed)
+    mc = mcnemar_test(a["hall"], b["hall"])
+    hr_a = float(a["hall"].mean()) if len(a["hall"]) else 0.0
+    hr_b = float(b["hall"].mean()) if len(b["hall"]) else 0.0
+    diff, lo, hi, p_boot = boot.get("hr", (0.0, 0.0, 0.0, 1.0))
+    return {
+        "n_paired": len(a["hall"]),
+        "hr_a": round(hr_a, 4),
+        "hr_b": round(hr_b, 4),
+        "hr_diff": round(diff, 4),
+        "ci_lo": round(lo, 4),
+        "ci_hi": round(hi, 4),
+        "p_bootstrap": round(p_boot, 4),
+        "a_only": mc["a_only"],
+        "b_only": mc["b_only"],
+        "p_mcnemar": round(mc["p_value"], 4),
+    }
+
+
+def leaderboard(csv_paths: List[str], n_resamples: int = N_RESAMPLES, seed: int = SEED) -> List[dict]:
+    """
+    Paired HR comparison for every pair of result files.
+    """
+    loaded = {path: load_samples(path) for path in csv_paths}
+    rows = []
+    for path_a, path_b in itertools.combinations(csv_paths, 2):
+        row = {"a": path_a, "b": path_b}
+        row.update(compare_pair(loaded[path_a], loaded[path_b], n_resamples=n_resamples, seed=seed))
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bootstrap CIs and paired significance tests for HR.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_ci = sub.add_parser("ci", help="bootstrap CIs for one evaluated CSV")
+    p_ci.add_argument("csv_path")
+
+    p_pair = sub.add_parser("paired", help="paired tests between two evaluated CSVs")
+    p_pair.add_argument("csv_a")
+    p_pair.add_argument("csv_b")
+
+    p_lb = sub.add_parser("leaderboard", help="paired HR tests for every pair of CSVs")
+    p_lb.add_argument("csv_paths", nargs="+")
+    p_lb.add_argument("--out", default="", help="write the table to this CSV")
+
+    for p in (p_ci, p_pair, p_lb):
+        p.add_argument("--resamples", type=int, default=N_RESAMPLES)
+        p.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    if args.cmd == "ci":
+        cis = bootstrap_ci(load_samples(args.csv_path), n_resamples=args.resamples, seed=args.seed)
+        rows = [
+            {"stat": name, "value": round(v, 4), "ci_lo": round(lo, 4), "ci_hi": round(hi, 4)}
+            for name, (v, lo, hi) in cis.items()
+        ]
+        print(calc.format_table(rows))
+
+    elif args.cmd == "paired":
+        a, b = align(load_samples(args.csv_a), load_samples(args.csv_b))
+        boot = paired_bootstrap(a, b, n_resamples=args.resamples, seed=args.seed)
+        mc = mcnemar_test(a["hall"], b["hall"])
+        print(f"Paired samples : {len(a['hall'])}")
+        print(f"McNemar        : a-only={mc['a_only']} b-only={mc['b_only']} p={mc['p_value']:.4g}")
+        print()
+        rows = [
+            {"stat": name, "diff(b-a)": round(d, 4), "ci_lo": round(lo, 4), "ci_hi": round(hi, 4), "p": round(p, 4)}
+            for name, (d, lo, hi, p) in boot.items()
+        ]
+        print(calc.format_table(rows))
+
+    else:
+        rows = leaderboard(args.csv_paths, n_resamples=args.resamples, seed=args.seed)
+        print(calc.format_table(rows))
+        if args.out and rows:
+            with open(args.out, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+                writer.writeheader()
+                writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import numpy as np
+import torch
+from typing import List, Optional, Tuple
+
+
+# =========================
+# Config
+# =========================
+SAMPLE_RATE = 16000
+# same framing as the BEATs fbank: 25 ms Hann window, 10 ms hop
+FRAME_WIN = 400
+FRAME_HOP = 160
+N_FFT = 512
+# band edges (Hz) for the band energy ratios
+BAND_EDGES = (0, 300, 2000, 5000, SAMPLE_RATE // 2 + 1)
+
+FEATURE_NAMES = [
+    "flatness",
+    "band_0_300",
+    "band_300_2k",
+    "band_2k_5k",
+    "band_5k_8k",
+    "crest_db",
+    "energy_std_db",
+    "flux",
+]
+
+# decisions
+SKIP = "skip"            # far from every exemplar: no spectral match, BEATs ranks every exemplar
+CONFIDENT = "confident"  # one exemplar clearly closest: use the cheap ranking
+AMBIGUOUS = "ambiguous"  # fall back to BEATs on a shortlist
+
+# distances are the RMS over features of the difference in units of each
+# feature's spread across exemplars (variants of an exemplar land ~0.1 away)
+SKIP_DISTANCE = 3.0
+CONFIDENT_DISTANCE = 0.5
+CONFIDENT_MARGIN = 2.0
+SHORTLIST = 8
+# SKIP gives zero exemplars instead of a full BEATs ranking; SKIP_DISTANCE was
+# only tuned on synthetic noise, so check `python encoder_benchmarks.py prefilter` first
+SKIP_EMPTY = False
+
+EPS = 1e-10
+
+
+def spectral_features(wav: torch.Tensor) -> np.ndarray:
+    """
+    Cheap DSP descriptors of a clip, computed on its power spectrogram.
+    The clip is peak-normalized first, as generate_noises.py normalizes the
+    exemplars, so every descriptor is independent of the recording gain.
+    wav: (1, T) or (T,) at SAMPLE_RATE
+    return: (len(FEATURE_NAMES),)
+    """
+    x = wav.reshape(-1).numpy().astype(np.float64)
+    x = x / (np.max(np.abs(x)) + EPS)
+    if x.shape[0] < FRAME_WIN:
+        x = np.pad(x, (0, FRAME_WIN - x.shape[0]))
+
+    frames = np.lib.stride_tricks.sliding_window_view(x, FRAME_WIN)[::FRAME_HOP]
+    power = np.abs(np.fft.rfft(frames * np.hanning(FRAME_WIN), n=N_FFT, axis=-1)) ** 2 + EPS  # (F, B)
+
+    flatness = np.exp(np.log(power).mean(axis=1)) / power.mean(axis=1)
+
+    freqs = np.fft.rfftfreq(N_FFT, d=1.0 / SAMPLE_RATE)
+    band_of = np.digitize(freqs, BAND_EDGES[1:-1])
+    band_energy = np.stack([power[:, band_of == b].sum() for b in range(len(BAND_EDGES) - 1)])
+    band_ratio = band_energy / band_energy.sum()
+
+    rms = np.sqrt(np.mean(x ** 2)) + EPS
+    crest_db = 20 * np.log10(np.max(np.abs(x)) / rms + EPS)
+    frame_db = 10 * np.log10(power.sum(axis=1))
+
+    log_power = np.log(power)
+    flux = np.mean(np.abs(np.diff(log_power, axis=0))) if log_power.shape[0] > 1 else 0.0
+
+    return np.concatenate([
+        [flatness.mean()],
+        band_ratio,
+        [crest_db, frame_db.std(), flux],
+    ])
+
+
+class SpectralPrefilter:
+    """
+    First retrieval tier: nearest exemplars by standardized DSP features.
+
+    classify() decides, per query, whether the BEATs forward can be skipped:
+    SKIP when the query is far from every exemplar (BEATs then ranks every
+    exemplar, or the query gets zero exemplars with skip_empty), CONFIDENT
+    when one exemplar is clearly closest (the cheap ranking is used as is),
+    otherwise AMBIGUOUS with a shortlist for BEATs to re-rank.
+    """
+
+    def __init__(self, skip_distance: float = SKIP_DISTANCE, confident_distance: float = CONFIDENT_DISTANCE,
+                 confident_margin: float = CONFIDENT_MARGIN, shortlist: int = SHORTLIST,
+                 skip_empty: bool = SKIP_EMPTY):
+        self.skip_distance = skip_distance
+        self.confident_distance = confident_distance
+        self.confident_margin = confident_margin
+        self.shortlist = shortlist
+        self.skip_empty = skip_empty
+        self.features: Optional[np.ndarray] = None  # (N, F) standardized exemplar features
+        self.mean: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    @property
+    def params(self) -> dict:
+        """
+        Everything that decides the tier's results; part of the KB version id.
+        """
+        return {
+            "features": FEATURE_NAMES,
+            "skip_distance": self.skip_distance,
+            "confident_distance": self.confident_distance,
+            "confident_margin": self.confident_margin,
+            "shortlist": self.shortlist,
+            "skip_empty": self.skip_empty,
+        }
+
+    @property
+    def size(self) -> int:
+        return 0 if self.features is None else self.features.shape[0]
+
+    def fit(self, wavs: List[torch.Tensor]) -> "SpectralPrefilter":
+        feats = np.stack([spectral_features(w) for w in wavs])
+        self.mean = feats.mean(axis=0)
+        # floor the spread so features that barely vary across exemplars do not dominate
+        self.scale = np.maximum(feats.std(axis=0), 0.05 * np.abs(self.mean) + 1e-3)
+        self.features = (feats - self.mean) / self.scale
+        return self
+
+    def distances(self, wav: torch.Tensor) -> np.ndarray:
+        """
+        return: (N,) distance from the query to every exemplar
+        """
+        q = (spectral_features(wav) - self.mean) / self.scale
+        return np.sqrt(((self.features - q) ** 2).mean(axis=1))
+
+    def classify(self, wav: torch.Tensor) -> Tuple[str, np.ndarray, np.ndarray]:
+        """
+        return: (decision, exemplar order nearest first, distances)
+        """
+        dists = self.distances(wav)
+        order = np.argsort(dists)
+        d1 = dists[order[0]]
+        d2 = dists[order[1]] if len(order) > 1 else np.inf
+        if d1 > self.skip_distance:
+            return SKIP, order, dists
+        if d1 <= self.confident_distance and d2 >= self.confident_margin * d1:
+            return CONFIDENT, order, dists
+        return AMBIGUOUS, order[: max(self.shortlist, 1)], dists
+
+
+def score(distance: float) -> float:
+    """
+    Map a feature distance to a (0, 1] similarity-like score.
+    """
+    return 1.0 / (1.0 + float(distance))
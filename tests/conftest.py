@@ -0,0 +1,33 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the scripts read data/ relative to the repo root, and BEATs.py imports its
+# sibling modules (backbone, quantizer) as top-level modules
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, "model", "beats"))
+os.chdir(ROOT)
+
+import pytest
+import torch
+
+
+@pytest.fixture(scope="session")
+def tiny_checkpoint(tmp_path_factory):
+    """
+    A randomly initialized two-layer BEATs checkpoint in the released format.
+    """
+    from model.beats.BEATs import BEATs, BEATsConfig
+
+    cfg = {
+        "input_patch_size": 16, "embed_dim": 64, "encoder_layers": 2, "encoder_embed_dim": 64,
+        "encoder_ffn_embed_dim": 128, "encoder_attention_heads": 4, "deep_norm": True,
+        "layer_norm_first": False, "relative_position_embedding": True, "gru_rel_pos": True,
+        "num_buckets": 320, "max_distance": 800, "finetuned_model": False,
+        "conv_pos": 128, "conv_pos_groups": 16,
+    }
+    torch.manual_seed(0)
+    path = tmp_path_factory.mktemp("beats") / "tiny.pt"
+    torch.save({"cfg": cfg, "model": BEATs(BEATsConfig(cfg)).state_dict()}, str(path))
+    return str(path)
@@ -0,0 +1,34 @@
+import csv
+import json
+
+import adaptive_topk_report as report
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def test_threshold_gates_only_beats_scored_exemplars(tmp_path):
+    spectral = [{"audio_path": "n1.wav", "similarity": 0.1, "tier": "spectral"},
+                {"audio_path": "n2.wav", "similarity": 0.05, "tier": "spectral"}]
+    beats = [{"audio_path": "n1.wav", "similarity": 0.9, "tier": "beats"},
+             {"audio_path": "n2.wav", "similarity": 0.4}]
+    nic_raw = tmp_path / "nic_raw.csv"
+    write_csv(nic_raw, ["file_name", "retrieved_exemplars"],
+              [["a.wav", json.dumps(spectral)], ["b.wav", json.dumps(beats)]])
+    for name in ("nic_eval.csv", "base_eval.csv"):
+        write_csv(tmp_path / name, ["file_name", "hallucination_detected"], [["a.wav", "false"], ["b.wav", "true"]])
+    noise_list = tmp_path / "noise_list.json"
+    noise_list.write_text(json.dumps([{"audio_path": "n1.wav", "caption": "x"},
+                                      {"audio_path": "n2.wav", "caption": "y"}]), encoding="utf-8")
+
+    rows = report.report(str(nic_raw), str(tmp_path / "nic_eval.csv"), str(tmp_path / "base_eval.csv"),
+                         max_k=4, thresholds=[0.0, 0.5, 1.01], audio_root=str(tmp_path),
+                         noise_list_path=str(noise_list))
+    # a.wav keeps both spectral exemplars at every threshold; b.wav loses its
+    # untagged (read as BEATs) 0.4 exemplar at 0.5 and both at 1.01
+    assert [r["mean_k"] for r in rows] == [2.0, 1.5, 1.0]
+    assert [r["zero_k"] for r in rows] == [0.0, 0.0, 0.5]
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+import audio_io
+import build_audio_shard
+
+
+@pytest.fixture
+def shard(tmp_path, monkeypatch):
+    clips = tmp_path / "clotho"
+    clips.mkdir()
+    (tmp_path / "noise").mkdir()
+    for name, value in (("a.wav", 0.25), ("b.wav", 0.5)):
+        sf.write(str(clips / name), np.full(1600, value, dtype=np.float32), audio_io.SAMPLE_RATE, subtype="FLOAT")
+    (tmp_path / "data.csv").write_text("file_name\na.wav\nb.wav\n", encoding="utf-8")
+
+    monkeypatch.setattr(build_audio_shard, "META_CSV", str(tmp_path / "data.csv"))
+    monkeypatch.setattr(build_audio_shard, "AUDIO_ROOT", str(clips))
+    monkeypatch.setattr(build_audio_shard, "NOISE_DIR", str(tmp_path / "noise"))
+    monkeypatch.setattr(build_audio_shard, "OUTPUT_PREFIX", str(tmp_path / "shard"))
+    build_audio_shard.main()
+    monkeypatch.setattr(audio_io, "_shard", None)
+    return audio_io.open_shard(str(tmp_path / "shard")), clips
+
+
+def test_lookup_serves_unchanged_files(shard):
+    shard, clips = shard
+    wav = shard.lookup(str(clips / "a.wav"))
+    assert wav.shape == (1, 1600)
+    assert float(wav[0, 0]) == 0.25
+
+
+def test_changed_file_is_decoded_again(shard):
+    shard, clips = shard
+    path = str(clips / "a.wav")
+    sf.write(path, np.full(800, -0.5, dtype=np.float32), audio_io.SAMPLE_RATE, subtype="FLOAT")
+    assert shard.lookup(path) is None
+    wav = audio_io.load_audio(path)
+    assert wav.shape == (1, 800)
+    assert float(wav[0, 0]) == -0.5
+
+
+def test_same_name_in_another_folder_is_not_served(shard, tmp_path):
+    shard, _ = shard
+    other = tmp_path / "other"
+    other.mkdir()
+    sf.write(str(other / "b.wav"), np.full(400, 0.1, dtype=np.float32), audio_io.SAMPLE_RATE, subtype="FLOAT")
+    assert shard.lookup(str(other / "b.wav")) is None
+    assert audio_io.load_audio(str(other / "b.wav")).shape == (1, 400)
+
+
+def test_shard_without_file_keys_is_rejected(tmp_path):
+    (tmp_path / "old.json").write_text('{"sample_rate": 16000, "files": {"a.wav": [0, 10]}}', encoding="utf-8")
+    np.zeros(10, dtype=np.float32).tofile(str(tmp_path / "old.f32"))
+    with pytest.raises(ValueError):
+        audio_io.AudioShard(str(tmp_path / "old"))
@@ -0,0 +1,99 @@
+import json
+import threading
+
+import numpy as np
+import pytest
+import soundfile as sf
+import torch
+
+import embedding_service
+import noise_retrieval
+
+
+class FakeKB:
+    """
+    encode_queries stand-in: each clip's embedding is its first sample, and
+    every call records its batch size.
+    """
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def encode_queries(self, wavs, batch_size):
+        self.batch_sizes.append(len(wavs))
+        return torch.stack([w.reshape(-1)[:1] for w in wavs])
+
+
+def test_micro_batcher_fills_batches_and_keeps_order():
+    kb = FakeKB()
+    batcher = embedding_service.MicroBatcher(kb, max_batch=4, max_wait_ms=200)
+    embs = batcher.encode([torch.full((1, 10), float(i)) for i in range(6)])
+    assert embs.reshape(-1).tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+    assert kb.batch_sizes == [4, 2]
+    assert (batcher.batches, batcher.clips) == (2, 6)
+
+
+def test_micro_batcher_merges_concurrent_requests():
+    kb = FakeKB()
+    batcher = embedding_service.MicroBatcher(kb, max_batch=8, max_wait_ms=500)
+    start = threading.Barrier(3)
+    out = {}
+
+    def request(i):
+        start.wait()
+        out[i] = batcher.encode([torch.full((1, 10), float(i))]).item()
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert out == {0: 0.0, 1: 1.0, 2: 2.0}
+    assert kb.batch_sizes == [3]
+
+
+@pytest.fixture(params=[False, True], ids=["beats", "prefilter"])
+def service(request, tmp_path, tiny_checkpoint):
+    rng = np.random.default_rng(0)
+    noise_list, queries = [], []
+    for i in range(4):
+        path = str(tmp_path / f"noise_{i}.wav")
+        sf.write(path, rng.standard_normal(16000).astype(np.float32) * 0.1, 16000, subtype="FLOAT")
+        noise_list.append({"audio_path": path, "caption": f"noise {i}"})
+    for i in range(3):
+        path = str(tmp_path / f"query_{i}.wav")
+        sf.write(path, rng.standard_normal(24000).astype(np.float32) * 0.1, 16000, subtype="FLOAT")
+        queries.append(path)
+
+    kb = noise_retrieval.NoiseKnowledgeBase(tiny_checkpoint)
+    kb.build_from_list(noise_list)
+    if request.param:
+        kb.enable_prefilter()
+    server = embedding_service.make_server(kb, port=0, max_wait_ms=1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield kb, f"http://127.0.0.1:{server.server_address[1]}", queries
+    server.shutdown()
+    server.server_close()
+
+
+def test_round_trip_matches_in_process_kb(service):
+    kb, url, queries = service
+    client = embedding_service.EmbeddingClient(
+        url, query_policy=noise_retrieval.QueryPolicy(), prefilter=kb.prefilter is not None
+    )
+    assert client.version == kb.version
+
+    torch.testing.assert_close(client.encode(queries), kb.encode_queries(
+        [noise_retrieval.load_audio(q) for q in queries]), rtol=1e-4, atol=1e-5)
+    remote, local = client.retrieve_batch(queries, topk=2), kb.retrieve_batch(queries, topk=2)
+    ranked = lambda results: [[(r["index"], r["tier"]) for r in rs] for rs in results]
+    assert ranked(remote) == ranked(local)
+    assert json.loads(json.dumps(remote))[0][0]["caption"].startswith("noise")
+
+
+def test_client_rejects_mismatched_settings(service):
+    kb, url, _ = service
+    with pytest.raises(ValueError):
+        embedding_service.EmbeddingClient(url, query_policy=noise_retrieval.QueryPolicy(mode="crops"))
+    with pytest.raises(ValueError):
+        embedding_service.EmbeddingClient(url, prefilter=kb.prefilter is None)
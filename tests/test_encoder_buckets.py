@@ -0,0 +1,59 @@
+import pytest
+import torch
+
+import noise_retrieval
+from noise_retrieval import BEATsEncoder
+
+
+def test_bucket_picks_smallest_fitting_bucket():
+    assert BEATsEncoder.bucket(1, [2, 5, 10]) == 2
+    assert BEATsEncoder.bucket(5, [2, 5, 10]) == 5
+    assert BEATsEncoder.bucket(6, [2, 5, 10]) == 10
+
+
+def test_bucket_rounds_long_inputs_to_largest_bucket_multiple():
+    assert BEATsEncoder.bucket(11, [2, 5, 10]) == 20
+    assert BEATsEncoder.bucket(30, [2, 5, 10]) == 30
+    assert BEATsEncoder.bucket(31, [2, 5, 10]) == 40
+
+
+def test_bucket_without_buckets_keeps_size():
+    assert BEATsEncoder.bucket(7, []) == 7
+
+
+@pytest.fixture(scope="module")
+def encoder(tiny_checkpoint):
+    return BEATsEncoder(tiny_checkpoint)
+
+
+# sub-window (< 400 samples), shorter than one patch, exactly one patch plus a
+# partial one, several patches
+@pytest.mark.parametrize("length", [300, 399, 1000, 2800, 5000, 5120, 8000, 16000])
+def test_batched_encoding_matches_single_clip(encoder, length):
+    torch.manual_seed(length)
+    wav = torch.randn(length)
+    single = encoder.encode_batch([wav])[0]
+    batched = encoder.encode_batch([wav, torch.randn(48000), torch.randn(7000)])[0]
+    torch.testing.assert_close(batched, single, rtol=1e-4, atol=1e-5)
+
+
+def test_bucket_padding_matches_single_clip(encoder, monkeypatch):
+    torch.manual_seed(0)
+    wavs = [torch.randn(n) for n in (5000, 21000, 33000)]
+    single = torch.stack([encoder.encode_batch([w])[0] for w in wavs])
+    # the compiled encoder pads every batch to a length bucket
+    monkeypatch.setattr(encoder, "length_buckets", [16000, 80000])
+    torch.testing.assert_close(encoder.encode_batch(wavs), single, rtol=1e-4, atol=1e-5)
+
+
+def test_chunk_settings_change_the_fingerprint(tiny_checkpoint):
+    fingerprints = {
+        BEATsEncoder(tiny_checkpoint).fingerprint,
+        BEATsEncoder(tiny_checkpoint, chunk_seconds=10.0).fingerprint,
+        BEATsEncoder(tiny_checkpoint, chunk_seconds=10.0, chunk_hop_seconds=2.5).fingerprint,
+    }
+    assert len(fingerprints) == 3
+    encoder = BEATsEncoder(tiny_checkpoint, chunk_seconds=10.0, chunk_hop_seconds=2.5)
+    assert encoder.fingerprint == noise_retrieval.encoder_fingerprint(
+        encoder.checkpoint_fingerprint, None, "fp32", 10.0, 2.5
+    )
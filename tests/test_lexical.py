@@ -0,0 +1,49 @@
+import pytest
+
+import calculate as calc
+
+
+@pytest.mark.parametrize("term, pos, expected", [
+    ("echo", "noun", {"echo", "echoes", "echoed", "echoing"}),
+    ("hum", "verb", {"hum", "hums", "hummed", "humming"}),
+    ("rumble", "verb", {"rumble", "rumbles", "rumbled", "rumbling"}),
+    ("loud", "adj", {"loud", "loudly"}),
+    ("cry", "verb", {"cry", "cries", "cried", "crying"}),
+    ("drop", "verb", {"drop", "drops", "dropped", "dropping"}),
+    ("buzz", "verb", {"buzz", "buzzes", "buzzed", "buzzing"}),
+    ("speech", "noun", {"speech", "speeches"}),
+    ("man", "noun", {"man", "men"}),
+    ("in the distance", None, {"in the distance"}),
+])
+def test_inflect(term, pos, expected):
+    assert calc.inflect(term, pos) == expected
+
+
+@pytest.mark.parametrize("term, pos, bogus", [
+    ("hit", "verb", "hited"),
+    ("open", "verb", "openned"),
+    ("engine", "verb", "engined"),
+    ("engine", "verb", "engining"),
+    ("sing", "verb", "singed"),
+    ("echo", "noun", "echos"),
+    ("nearby", None, "nearbies"),
+])
+def test_inflect_no_non_words(term, pos, bogus):
+    assert bogus not in calc.inflect(term, pos)
+
+
+def test_descriptors_match_verb_and_adverb_uses():
+    counts = calc.MATCHER.count("a low humming and rumbling that echoes loudly")
+    assert counts["ACOUSTIC_TERMS"] == {"hum": 1, "rumble": 1, "echo": 1}
+    assert counts["DEFINITE_TERMS"] == {"loud": 1}
+
+
+def test_irregular_forms_credit_only_their_term():
+    counts = calc.MATCHER.count("the grass singed while a man sang")
+    assert counts["EVENT_VERBS"] == {"sing": 1}
+
+
+def test_word_boundaries():
+    counts = calc.MATCHER.count("a woman hears a low thrum")
+    assert "man" not in counts["DEFINITE_TERMS"]
+    assert "run" not in counts["EVENT_VERBS"]
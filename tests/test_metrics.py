@@ -0,0 +1,93 @@
+import pytest
+
+import calculate as calc
+import result_store
+
+HEADER = "file_name,model_caption,hallucination_detected,hallucination_types\n"
+
+
+def rows(*flags):
+    return "".join(f"c{i}.wav,a dog barks,{str(f).lower()},[]\n" for i, f in enumerate(flags))
+
+
+def test_final_record_without_newline_is_counted(tmp_path):
+    path = tmp_path / "eval.csv"
+    path.write_text(HEADER + rows(True, False).rstrip("\n"), encoding="utf-8")
+    m = calc.compute_metrics(str(path))
+    assert (m.total, m.hall_count) == (2, 1)
+
+
+def test_open_quoted_final_record_is_not_counted(tmp_path):
+    path = tmp_path / "eval.csv"
+    path.write_text(HEADER + rows(True) + 'c9.wav,"a dog', encoding="utf-8")
+    assert calc.compute_metrics(str(path)).total == 1
+
+
+def test_summary_reads_only_appended_rows(tmp_path):
+    path, summary = tmp_path / "eval.csv", tmp_path / "summary.json"
+    path.write_text(HEADER + rows(True, False), encoding="utf-8")
+    assert calc.update_summary(str(path), str(summary)).total == 2
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(rows(True))
+    m = calc.update_summary(str(path), str(summary))
+    assert (m.total, m.hall_count) == (3, 2)
+
+
+def test_summary_detects_rewritten_csv(tmp_path):
+    path, summary = tmp_path / "eval.csv", tmp_path / "summary.json"
+    path.write_text(HEADER + rows(True, False), encoding="utf-8")
+    calc.update_summary(str(path), str(summary))
+
+    # same length, different content
+    path.write_text(HEADER + rows(False, True), encoding="utf-8")
+    with pytest.raises(ValueError, match="rewritten"):
+        calc.update_summary(str(path), str(summary))
+
+
+def test_summary_detects_extended_last_record(tmp_path):
+    path, summary = tmp_path / "eval.csv", tmp_path / "summary.json"
+    path.write_text(HEADER + rows(True).rstrip("\n"), encoding="utf-8")
+    calc.update_summary(str(path), str(summary))
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(" loudly\n")
+    with pytest.raises(ValueError, match="extended"):
+        calc.update_summary(str(path), str(summary))
+
+
+def test_parquet_summary_is_incremental(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(result_store, "PARQUET_BATCH_ROWS", 2)
+    csv_path, parquet, summary = tmp_path / "eval.csv", tmp_path / "eval.parquet", tmp_path / "summary.json"
+
+    csv_path.write_text(HEADER + rows(True, False, True), encoding="utf-8")
+    result_store.csv_to_parquet(str(csv_path), str(parquet))
+    assert calc.update_summary(str(parquet), str(summary)).total == 3
+
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write(rows(True, True))
+    result_store.csv_to_parquet(str(csv_path), str(parquet))
+
+    seen = []
+    real = result_store.iter_parquet_rows
+
+    def spy(path, start=0, columns=None):
+        seen.append(start)
+        return real(path, start=start, columns=columns)
+
+    monkeypatch.setattr(result_store, "iter_parquet_rows", spy)
+    m = calc.update_summary(str(parquet), str(summary))
+    assert m.total == 5
+    assert 0 not in seen  # never rescanned from the first row
+
+
+def test_iter_parquet_rows_skips_row_groups(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(result_store, "PARQUET_BATCH_ROWS", 2)
+    csv_path, parquet = tmp_path / "eval.csv", tmp_path / "eval.parquet"
+    csv_path.write_text(HEADER + rows(*[True] * 5), encoding="utf-8")
+    result_store.csv_to_parquet(str(csv_path), str(parquet))
+
+    names = [r["file_name"] for r in result_store.iter_parquet_rows(str(parquet), start=3, columns=["file_name"])]
+    assert names == ["c3.wav", "c4.wav"]
@@ -0,0 +1,42 @@
+import threading
+import time
+
+import run_inference_NIC as nic
+
+
+def test_failed_retrieval_does_not_free_request_slots(monkeypatch):
+    # requests submitted to the pool and not finished yet; gate() runs once per
+    # variant right before its request is submitted
+    lock = threading.Lock()
+    pending, peak = [0], [0]
+
+    def retrieve(path, topk):
+        if path == "bad.wav":
+            raise RuntimeError("no audio")
+        return []
+
+    def gate(retrieved, k):
+        with lock:
+            pending[0] += 1
+            peak[0] = max(peak[0], pending[0])
+        return retrieved
+
+    def caption(path, exemplars):
+        time.sleep(0.2)
+        with lock:
+            pending[0] -= 1
+        return path
+
+    monkeypatch.setattr(nic, "get_client", lambda: None)
+    monkeypatch.setattr(nic, "retrieve", retrieve)
+    monkeypatch.setattr(nic, "gate", gate)
+    monkeypatch.setattr(nic, "caption_or_error", caption)
+    monkeypatch.setattr(nic, "SLEEP_BETWEEN_REQ", 0.0)
+
+    jobs = [("bad.wav", [1, 2]), ("a.wav", [1]), ("b.wav", [1])]
+    out = list(nic.pipelined(jobs, retrieval_ahead=2, concurrency=1))
+
+    assert [[c for c, _ in variants] for _, variants in out] == [
+        ["[ERROR] no audio", "[ERROR] no audio"], ["a.wav"], ["b.wav"],
+    ]
+    assert peak[0] == 1
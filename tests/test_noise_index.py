@@ -0,0 +1,30 @@
+import torch
+
+from noise_index import IVFIndex, exact_search, l2_normalize
+
+
+def clustered(n_per, dim=16, n_clusters=5, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    centers = torch.randn(n_clusters, dim, generator=g) * 5
+    return l2_normalize(centers.repeat_interleave(n_per, 0) + 0.1 * torch.randn(n_clusters * n_per, dim, generator=g))
+
+
+def test_short_probed_lists_fall_back_to_exact():
+    # 10 vectors in 5 lists: one probed list never holds k=10 neighbours
+    emb = clustered(2)
+    index = IVFIndex(nlist=5, nprobe=1).build(emb)
+    sims, ids = index.search(emb[:3], 10)
+
+    exact_sims, exact_ids = exact_search(emb, emb[:3], 10)
+    assert (ids >= 0).all()
+    assert torch.isfinite(sims).all()
+    assert torch.equal(ids, exact_ids)
+    assert torch.allclose(sims, exact_sims)
+
+
+def test_full_lists_return_k_neighbours():
+    emb = clustered(20)
+    index = IVFIndex(nlist=5, nprobe=1).build(emb)
+    sims, ids = index.search(emb[:4], 4)
+    assert ids.shape == (4, 4)
+    assert (ids >= 0).all() and torch.isfinite(sims).all()
@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+import pytest
+
+import noise_retrieval
+import run_inference_NIC as nic
+
+
+def write_store(prefix, fingerprint="fp", query_policy=None):
+    np.save(str(prefix) + ".npy", np.zeros((1, 4), dtype=np.float32))
+    index = {"fingerprint": fingerprint, "file_names": ["a.wav"]}
+    if query_policy is not None:
+        index["query_policy"] = query_policy.identity()
+    with open(str(prefix) + ".json", "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    return str(prefix)
+
+
+CROPS = noise_retrieval.QueryPolicy(mode="crops", n_crops=3, crop_seconds=2.0)
+
+
+def test_policy_mismatch_is_rejected(tmp_path):
+    prefix = write_store(tmp_path / "q", query_policy=CROPS)
+    assert noise_retrieval.QueryEmbeddingStore(prefix, "fp", CROPS).get("a.wav").shape == (4,)
+    with pytest.raises(ValueError):
+        noise_retrieval.QueryEmbeddingStore(prefix, "fp", noise_retrieval.QueryPolicy())
+
+
+def test_index_without_policy_holds_full_clip_embeddings(tmp_path):
+    prefix = write_store(tmp_path / "q")
+    # crop settings do not matter in full mode
+    noise_retrieval.QueryEmbeddingStore(prefix, "fp", noise_retrieval.QueryPolicy(n_crops=5))
+    with pytest.raises(ValueError):
+        noise_retrieval.QueryEmbeddingStore(prefix, "fp", CROPS)
+
+
+def test_retrieval_store_version_tracks_query_embeddings(tmp_path, monkeypatch):
+    monkeypatch.setattr(nic, "RETRIEVAL_STORE", str(tmp_path / "r.sqlite"))
+    monkeypatch.setattr(nic, "EMBEDDING_SERVICE_URL", "")
+    monkeypatch.setattr(nic, "SPECTRAL_PREFILTER", False)
+    monkeypatch.setattr(nic, "get_noise_list", lambda: [])
+    monkeypatch.setattr(noise_retrieval, "checkpoint_fingerprint", lambda path: "ckpt")
+
+    def version(prefix):
+        monkeypatch.setattr(nic, "QUERY_EMB_PREFIX", prefix)
+        nic.get_retrieval_store.cache_clear()
+        store, v, _ = nic.get_retrieval_store()
+        store.close()
+        return v
+
+    full = write_store(tmp_path / "full", query_policy=noise_retrieval.QueryPolicy())
+    crops = write_store(tmp_path / "crops", query_policy=CROPS)
+    versions = [version(""), version(full), version(crops)]
+    nic.get_retrieval_store.cache_clear()
+    assert len(set(versions)) == 3
+
+
+def test_clip_missing_from_query_store_is_stored_under_base_version(tmp_path, monkeypatch):
+    import retrieval_store
+
+    store = retrieval_store.RetrievalStore(str(tmp_path / "r.sqlite"))
+    calls = []
+
+    class KB:
+        def retrieve(self, audio_path, topk, query_embedding=None):
+            calls.append(query_embedding)
+            return [{"index": 0, "audio_path": "n.wav", "caption": "noise", "similarity": 0.5, "tier": "beats"}]
+
+    query_store = noise_retrieval.QueryEmbeddingStore(write_store(tmp_path / "q"))
+    monkeypatch.setattr(nic, "get_retrieval_store", lambda: (store, "extended", "base"))
+    monkeypatch.setattr(nic, "get_query_store", lambda: query_store)
+    monkeypatch.setattr(nic, "get_noise_kb", lambda: KB())
+    monkeypatch.setattr(nic, "get_noise_list", lambda: [{"audio_path": "n.wav", "caption": "noise"}])
+
+    nic.retrieve("clips/a.wav", topk=1)
+    nic.retrieve("clips/b.wav", topk=1)
+    assert store.get("a.wav", "extended", 1) is not None
+    assert store.get("b.wav", "extended", 1) is None
+    assert store.get("b.wav", "base", 1) is not None
+
+    # rerunning reads both from the store
+    nic.retrieve("clips/a.wav", topk=1)
+    nic.retrieve("clips/b.wav", topk=1)
+    assert [q is None for q in calls] == [False, True]
+    store.close()
@@ -0,0 +1,49 @@
+import csv
+
+import pytest
+
+import significance
+
+
+FIELDS = ["file_name", "model_caption", "hallucination_detected", "hallucination_types"]
+
+
+def write_csv(path, rows, encoding):
+    with open(path, "w", newline="", encoding=encoding) as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def row(name, hall):
+    return {"file_name": name, "model_caption": "a dog barks", "hallucination_detected": hall,
+            "hallucination_types": "[]"}
+
+
+def test_load_samples_reads_bom_prefixed_csv(tmp_path):
+    # evaluation.py writes utf-8-sig, so the first header starts with a BOM
+    path = tmp_path / "eval.csv"
+    write_csv(path, [row("a.wav", True), row("b.wav", False)], "utf-8-sig")
+    assert open(path, "rb").read(3) == b"\xef\xbb\xbf"
+
+    samples = significance.load_samples(str(path))
+    assert list(samples["file_name"]) == ["a.wav", "b.wav"]
+    assert list(samples["hall"]) == [1.0, 0.0]
+
+
+def test_align_pairs_bom_csv_by_file_name(tmp_path):
+    a, b = tmp_path / "a.csv", tmp_path / "b.csv"
+    write_csv(a, [row("x.wav", True), row("y.wav", False), row("z.wav", True)], "utf-8-sig")
+    write_csv(b, [row("z.wav", False), row("x.wav", False)], "utf-8")
+
+    sa, sb = significance.align(significance.load_samples(str(a)), significance.load_samples(str(b)))
+    assert list(sa["file_name"]) == list(sb["file_name"]) == ["x.wav", "z.wav"]
+    assert list(sa["hall"]) == [1.0, 1.0]
+    assert list(sb["hall"]) == [0.0, 0.0]
+
+
+def test_load_samples_requires_file_name(tmp_path):
+    path = tmp_path / "bad.csv"
+    path.write_text("name,hallucination_detected\na.wav,true\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        significance.load_samples(str(path))
@@ -0,0 +1,92 @@
+import importlib
+
+import numpy as np
+import pytest
+import soundfile as sf
+import torch
+
+import noise_retrieval
+import spectral_prefilter as sp
+
+FAMILIES = ["bubble_noise", "silence_device_hum", "pink_noise", "bandpass_noise", "modulated_noise", "glitch_noise"]
+GAINS = (0.25, 0.5, 2.0)
+
+
+@pytest.fixture
+def generate(tmp_path, monkeypatch):
+    """
+    Clips from model/beats/generate_noises.py, written under tmp_path.
+    """
+    # the module creates its output folder on import
+    monkeypatch.chdir(tmp_path)
+    gen = importlib.import_module("generate_noises")
+    monkeypatch.setattr(gen, "OUT_DIR", str(tmp_path))
+
+    def run(seed):
+        np.random.seed(seed)
+        clips = {}
+        for family in FAMILIES:
+            getattr(gen, family)()
+            wav, _ = sf.read(str(tmp_path / f"{family}_1s.wav"), dtype="float32")
+            clips[family] = torch.from_numpy(wav)
+        return clips
+
+    return run
+
+
+@pytest.fixture
+def prefilter(generate):
+    exemplars = generate(0)
+    return sp.SpectralPrefilter().fit([exemplars[f] for f in FAMILIES])
+
+
+@pytest.mark.parametrize("family", FAMILIES)
+def test_features_do_not_depend_on_gain(generate, family):
+    wav = generate(1)[family]
+    ref = sp.spectral_features(wav)
+    for gain in GAINS:
+        np.testing.assert_allclose(sp.spectral_features(wav * gain), ref, rtol=1e-6, atol=1e-6)
+
+
+@pytest.mark.parametrize("family", FAMILIES)
+def test_classification_is_stable_across_gains(generate, prefilter, family):
+    wav = generate(1)[family]
+    decision, order, _ = prefilter.classify(wav)
+    # bubble and modulated noise are both amplitude-modulated white noise and can swap places
+    assert family in [FAMILIES[i] for i in order[:2]]
+    for gain in GAINS:
+        scaled_decision, scaled_order, _ = prefilter.classify(wav * gain)
+        assert scaled_decision == decision
+        assert scaled_order[0] == order[0]
+
+
+def tone(freq=1000.0, seconds=1.0):
+    t = np.arange(int(sp.SAMPLE_RATE * seconds)) / sp.SAMPLE_RATE
+    return torch.from_numpy(np.sin(2 * np.pi * freq * t).astype(np.float32))
+
+
+def test_skip_empty_gives_zero_exemplars(generate):
+    exemplars = generate(0)
+    prefilter = sp.SpectralPrefilter(skip_distance=0.5, skip_empty=True).fit([exemplars[f] for f in FAMILIES])
+    assert prefilter.classify(tone())[0] == sp.SKIP
+
+    # the SKIP branch never touches the encoder or the embeddings
+    kb = object.__new__(noise_retrieval.NoiseKnowledgeBase)
+    kb.prefilter = prefilter
+    assert kb._retrieve_tiered([tone()], topk=4, encode=None) == [[]]
+
+
+def test_skip_falls_back_to_beats_over_every_exemplar(generate, tmp_path, tiny_checkpoint):
+    exemplars = generate(0)
+    noise_list = []
+    for family in FAMILIES:
+        path = str(tmp_path / f"exemplar_{family}.wav")
+        sf.write(path, exemplars[family].numpy(), sp.SAMPLE_RATE, subtype="FLOAT")
+        noise_list.append({"audio_path": path, "caption": family})
+    kb = noise_retrieval.NoiseKnowledgeBase(tiny_checkpoint)
+    kb.build_from_list(noise_list)
+    reference = kb.retrieve_wavs([tone()], topk=4)
+
+    kb.enable_prefilter(sp.SpectralPrefilter(skip_distance=0.5))
+    assert kb.prefilter.classify(tone())[0] == sp.SKIP
+    assert kb.retrieve_wavs([tone()], topk=4) == reference